@@ -1,31 +1,51 @@
 #!/usr/bin/env python3
 
 # Dependencies
-import tweepy, os, jsonpickle, re, json, datetime, time, gzip
-import analyze, log
-from collections import defaultdict
+import tweepy, os, jsonpickle, re, json, datetime, time, gzip, io, threading, heapq
+import analyze, log, tweetformat, tweetarchive, metrics, profiling, journal, crawlstate
+from collections import defaultdict, deque
+from array import array
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
+# Slotted classes so a large corpus of tweets doesn't carry a dict per tweet
+# Tweets saved before we kept IDs have an ID of None, or in JSON files no ID
+# at all, so read it with tweetID()
 class Tweet(object):
-	def __init__(self, user, text, timestamp, mentions):
+	__slots__ = ("user", "text", "timestamp", "mentions", "id")
+
+	def __init__(self, user, text, timestamp, mentions, id=None):
 		self.user = user
 		self.text = text
 		self.timestamp = timestamp
 		self.mentions = mentions
+		self.id = id
 
 class Retweet(Tweet):
-	def __init__(self, user, text, timestamp, mentions, source, retweets):
-		super().__init__(user, text, timestamp, mentions)
+	__slots__ = ("source", "retweets")
+
+	def __init__(self, user, text, timestamp, mentions, source, retweets, id=None):
+		super().__init__(user, text, timestamp, mentions, id)
 		self.source = source
 		self.retweets = retweets
 
-# When you hit the Twitter API for too long it blocks for 15 minutes
-# we'll just wait around for that.
+def tweetID(tweet):
+	return getattr(tweet, "id", None)
+
+# When you hit the Twitter API for too long it blocks for 15 minutes.
+# The key pool's governors pace requests so this should be rare, but if it
+# happens anyway they've recorded the reset time from the response headers,
+# so we just retry and let the pool pick another key or wait it out.
 def limit_handled(api, cursor):
 	while True:
 		try:
 			yield cursor.next()
 		except tweepy.error.TweepError as e:
-			response = api.last_response
+			# Use the response attached to the error, since other threads
+			# may be making requests at the same time
+			response = e.response
+			if( response is None ):
+				log.log(log.warn, "Exception during data collection: " + str(e))
+				return
 			if( response.status_code >= 500 ):
 				log.log(log.warn, "Error on Twitter's end during data collection: " + str(e))
 				return
@@ -37,11 +57,7 @@ def limit_handled(api, cursor):
 				return
 			remaining = int(response.headers['x-rate-limit-remaining'])
 			if( remaining == 0 ):
-				reset = int(response.headers['x-rate-limit-reset'])
-				reset = datetime.datetime.fromtimestamp(reset)
-				delay = (reset - datetime.datetime.now()).total_seconds() + 10 # 10 second buffer
-				log.log(log.info, "Rate limited, sleeping "+str(delay)+" seconds")
-				time.sleep(delay)
+				log.log(log.debug, "API key rate limited, retrying with the key pool")
 			else:
 				log.log(log.warn, "Exception during data collection: " + str(e))
 				return
@@ -49,41 +65,222 @@ def limit_handled(api, cursor):
 		except StopIteration:
 			return
 
+# Tweet files we know how to read, in order of preference, as
+# (suffix, binary format, GZIP compressed)
+tweetFileTypes = [
+	(".tweets.gz", True, True),
+	(".tweets", True, False),
+	(".json.gz", False, True),
+	(".json", False, False),
+]
+
+# Any of the functions taking a tweetdir will also accept a tweet archive
+# (see tweetarchive), which keeps every user's tweets in a single file
+
 # Returns whether we have tweets from a particular user stored
-# Detects compressed and plain JSON files
+# Detects binary and JSON files, compressed or not
 def userTweetsPresent(username, tweetdir):
-	cFile = os.path.isfile(tweetdir + "/" + username + ".json.gz")
-	pFile = os.path.isfile(tweetdir + "/" + username + ".json")
-	return cFile or pFile
-
-# Saves a tweet blob as JSON, with optional GZIP compression
-def saveTweetsToFile(username, tweets, tweetdir, compression):
-	tweetDump = jsonpickle.encode(tweets)
-	if( compression ):
-		f = gzip.open(tweetdir + "/" + username + ".json.gz", "wb")
-		tweetDump = bytearray(tweetDump, "utf-8")
+	if( tweetarchive.isArchive(tweetdir) ):
+		return tweetarchive.openArchive(tweetdir).present(username)
+	return userTweetsFilename(username, tweetdir) != None
+
+# Returns the set of users from a list that we have tweets stored for
+# Archives can answer this for a whole layer in a few queries
+def presentUsers(usernames, tweetdir):
+	if( tweetarchive.isArchive(tweetdir) ):
+		return tweetarchive.openArchive(tweetdir).presentUsers(usernames)
+	return set([u for u in usernames if userTweetsPresent(u, tweetdir)])
+
+# Returns every username we have tweets stored for
+def listUsers(tweetdir):
+	if( tweetarchive.isArchive(tweetdir) ):
+		return list(tweetarchive.openArchive(tweetdir).usernames())
+	usernames = set()
+	for filename in os.listdir(tweetdir):
+		if( filename.startswith(".") ):
+			continue # Skip summaries and other hidden files
+		for (suffix, binary, compressed) in tweetFileTypes:
+			if( filename.endswith(suffix) ):
+				usernames.add(filename[:-len(suffix)])
+				break
+	return sorted(usernames)
+
+# Returns the name of the file holding a user's tweets, or None if we don't
+# have any. Prefers binary files, then compressed files
+def userTweetsFilename(username, tweetdir):
+	for (suffix, binary, compressed) in tweetFileTypes:
+		filename = tweetdir + "/" + username + suffix
+		if( os.path.isfile(filename) ):
+			return filename
+	return None
+
+# A name to write a file under before renaming it into place, unique to
+# this process and thread
+def temporaryName(filename):
+	return filename + "." + str(os.getpid()) + "-" + str(threading.get_ident()) + ".tmp"
+
+# Removes the temporary files an interrupted crawl left in a tweetdir (see
+# temporaryName), returning how many there were. Don't call this while
+# anything else is writing to the tweetdir.
+def removeTemporaryFiles(tweetdir):
+	if( tweetarchive.isArchive(tweetdir) ):
+		return 0
+	removed = 0
+	for directory in [tweetdir, tweetdir + "/.summaries"]:
+		if( not os.path.isdir(directory) ):
+			continue
+		for filename in os.listdir(directory):
+			if( re.search(r"\.[0-9]+-[0-9]+\.tmp$", filename) ):
+				os.unlink(directory + "/" + filename)
+				removed += 1
+	return removed
+
+# Saves tweets as JSON, or in our binary format (see tweetformat), with
+# optional GZIP compression
+# Also writes a summary of the tweets so we don't have to decode them again
+# Archives always use the binary format
+def saveTweetsToFile(username, tweets, tweetdir, compression, binary=False):
+	start = time.perf_counter()
+	if( tweetarchive.isArchive(tweetdir) ):
+		f = io.BytesIO()
+		tweetformat.writeTweets(f, tweets)
+		summary = summarizeTweets(tweets)
+		size = tweetarchive.openArchive(tweetdir).save(username, f.getvalue(), compression, summary)
+		metrics.observe("encode", time.perf_counter() - start)
+		metrics.count("bytesWritten", size)
+		return
+	# Written under a temporary name and then renamed, so a crash can't
+	# leave a half-written file that looks like a user we have
+	if( binary ):
+		filename = tweetdir + "/" + username + ".tweets"
+		if( compression ):
+			filename += ".gz"
+		tmpFilename = temporaryName(filename)
+		if( compression ):
+			f = gzip.open(tmpFilename, "wb")
+		else:
+			f = open(tmpFilename, "wb")
+		tweetformat.writeTweets(f, tweets)
+		f.close()
 	else:
-		f = open(tweetdir + "/" + username + ".json", "w")
-	f.write(tweetDump)
-	f.close()
+		tweetDump = jsonpickle.encode(tweets)
+		if( compression ):
+			filename = tweetdir + "/" + username + ".json.gz"
+			tmpFilename = temporaryName(filename)
+			f = gzip.open(tmpFilename, "wb")
+			tweetDump = bytearray(tweetDump, "utf-8")
+		else:
+			filename = tweetdir + "/" + username + ".json"
+			tmpFilename = temporaryName(filename)
+			f = open(tmpFilename, "w")
+		f.write(tweetDump)
+		f.close()
+	os.replace(tmpFilename, filename)
+	metrics.observe("encode", time.perf_counter() - start)
+	metrics.count("bytesWritten", os.path.getsize(filename))
+	saveUserSummary(username, tweetdir, summarizeTweets(tweets))
+
+# Reads tweets back from file one at a time
+# Binary files are streamed, JSON files have to be decoded all at once
+def iterTweetsFromFile(username, tweetdir):
+	if( tweetarchive.isArchive(tweetdir) ):
+		data = tweetarchive.openArchive(tweetdir).load(username)
+		if( data == None ):
+			raise FileNotFoundError("No tweets stored for " + username)
+		binary = True
+		f = io.BytesIO(data)
+	else:
+		filename = userTweetsFilename(username, tweetdir)
+		if( filename == None ):
+			raise FileNotFoundError("No tweets stored for " + username)
+		binary = filename.endswith(".tweets") or filename.endswith(".tweets.gz")
+		if( filename.endswith(".gz") ):
+			f = gzip.open(filename, "rb")
+		else:
+			f = open(filename, "rb")
+	with f:
+		if( not binary ):
+			for tweet in jsonpickle.decode(f.read().decode()):
+				yield tweet
+			return
+		for (user, text, timestamp, mentions, source, retweets, id) in tweetformat.readTweets(f):
+			if( source == None ):
+				yield Tweet(user, text, timestamp, mentions, id)
+			else:
+				yield Retweet(user, text, timestamp, mentions, source, retweets, id)
 
 # Read tweets back from file
-# Loads compressed file if available, falls back to plaintext otherwise
+# Loads binary files if available, then compressed files, then plaintext
 def loadTweetsFromFile(username, tweetdir):
-	pFilename = tweetdir + "/" + username + ".json"
-	cFilename = pFilename + ".gz"
-	cFile = os.path.isfile(cFilename)
-	pFile = os.path.isfile(pFilename)
-	if( cFile ):
-		f = gzip.open(cFilename, "rb")
-		blob = f.read()
+	return list(iterTweetsFromFile(username, tweetdir))
+
+# Summaries are kept in a hidden directory inside the tweetdir, one per user
+def summaryFilename(username, tweetdir):
+	return tweetdir + "/.summaries/" + username + ".json"
+
+# Counts everything we need to know about a user's tweets to build maps:
+# how many tweets they have, who they retweeted, and who they mentioned
+# outside of retweets
+# Also records the ID of their newest tweet (if we know it), so a refresh
+# can ask for just the tweets after it
+def summarizeTweets(tweets):
+	retweeted = defaultdict(lambda: 0)
+	mentioned = defaultdict(lambda: 0)
+	numTweets = 0
+	newest = None
+	for tweet in tweets:
+		numTweets += 1
+		if( tweetID(tweet) != None and (newest == None or tweetID(tweet) > newest) ):
+			newest = tweetID(tweet)
+		if( isinstance(tweet, Retweet) ):
+			retweeted[tweet.source] += 1
+		else:
+			for user in tweet.mentions:
+				mentioned[user] += 1
+	return {"tweets": numTweets, "mentions": dict(mentioned), "retweets": dict(retweeted), "newest": newest}
+
+# Saves a user's summary, stamped with the size and modification time of
+# their tweet file so we can tell when it goes stale.
+# A read-only tweetdir just means we can't cache anything.
+def saveUserSummary(username, tweetdir, summary):
+	filename = summaryFilename(username, tweetdir)
+	st = os.stat(userTweetsFilename(username, tweetdir))
+	summary["mtime"] = st.st_mtime_ns
+	summary["size"] = st.st_size
+	tmpFilename = temporaryName(filename)
+	try:
+		os.makedirs(tweetdir + "/.summaries", exist_ok=True)
+		f = open(tmpFilename, "w")
+		f.write(json.dumps(summary))
 		f.close()
-		return jsonpickle.decode(blob.decode())
-	else:
-		f = open(pFilename, "r")
-		blob = f.read()
+		os.replace(tmpFilename, filename)
+	except OSError as e:
+		log.log(log.debug, "Could not save summary for " + username + ": " + str(e))
+
+# Returns the summary for a user's tweets, only decoding the tweet file if
+# the summary is missing or older than the tweets
+def loadUserSummary(username, tweetdir):
+	if( tweetarchive.isArchive(tweetdir) ):
+		archive = tweetarchive.openArchive(tweetdir)
+		summary = archive.summary(username)
+		if( summary == None ):
+			with metrics.timer("decode"):
+				summary = summarizeTweets(iterTweetsFromFile(username, tweetdir))
+			archive.saveSummary(username, summary)
+		return summary
+	st = os.stat(userTweetsFilename(username, tweetdir))
+	try:
+		f = open(summaryFilename(username, tweetdir), "r")
+		summary = json.loads(f.read())
 		f.close()
-		return jsonpickle.decode(blob)
+		if( summary["mtime"] == st.st_mtime_ns and summary["size"] == st.st_size ):
+			return summary
+	except (OSError, ValueError, KeyError):
+		pass
+	with metrics.timer("decode"):
+		summary = summarizeTweets(iterTweetsFromFile(username, tweetdir))
+	saveUserSummary(username, tweetdir, summary)
+	return summary
 
 # Returns the usernames of people mentioned in a body of text
 def getMentionsFromText(text):
@@ -94,11 +291,23 @@ def getMentionsFromText(text):
 		usernames.add(username[1:].lower())
 	return list(usernames)
 
-# Downloads, parses, and saves tweets for a user
-def getUserTweets(api, username, tweetdir, numtweets, compression):
-	cursor = tweepy.Cursor(api.user_timeline, screen_name=username, count=numtweets)
+# Downloads and parses tweets for a user, newest first. With `sinceID`, only
+# downloads tweets newer than that one.
+# `api` is a KeyPool, which paces requests and spreads them over our API keys
+def fetchUserTweets(api, username, numtweets, sinceID=None):
+	if( sinceID == None ):
+		cursor = tweepy.Cursor(api.method("user_timeline"), screen_name=username, count=numtweets)
+	else:
+		cursor = tweepy.Cursor(api.method("user_timeline"), screen_name=username, count=numtweets, since_id=sinceID)
 	tweets = []
+	# Time spent waiting on the cursor (requests and tweepy's parsing) is
+	# the fetch stage, time spent on each tweet after that is ours
+	fetchTime = 0.0
+	parseTime = 0.0
+	start = time.perf_counter()
 	for tweet in limit_handled(api, cursor.items()):
+		fetched = time.perf_counter()
+		fetchTime += fetched - start
 		mentions = getMentionsFromText(tweet.text)
 		date = tweet.created_at
 		text = tweet.text
@@ -106,35 +315,105 @@ def getUserTweets(api, username, tweetdir, numtweets, compression):
 		if( hasattr(tweet, "retweeted_status") ):
 			orig_author = tweet.retweeted_status.user.screen_name.lower()
 			rt_count = tweet.retweeted_status.retweet_count
-			rt = Retweet(source, text, date, mentions, orig_author, rt_count)
+			rt = Retweet(source, text, date, mentions, orig_author, rt_count, tweet.id)
 			tweets.append(rt)
 		else:
-			tw = Tweet(source, text, date, mentions)
+			tw = Tweet(source, text, date, mentions, tweet.id)
 			tweets.append(tw)
-	saveTweetsToFile(username, tweets, tweetdir, compression)
+		start = time.perf_counter()
+		parseTime += start - fetched
+	fetchTime += time.perf_counter() - start
+	metrics.observe("fetch", fetchTime)
+	metrics.observe("parse", parseTime)
+	metrics.count("tweetsFetched", len(tweets))
+	return tweets
+
+# Downloads, parses, and saves tweets for a user
+def getUserTweets(api, username, tweetdir, numtweets, compression, binary=False):
+	tweets = fetchUserTweets(api, username, numtweets)
+	with metrics.timer("save"):
+		saveTweetsToFile(username, tweets, tweetdir, compression, binary)
+
+# Returns the ID of the newest tweet we have from a user, or None if we
+# don't know it, because their tweets were saved before we kept IDs
+def newestTweetID(username, tweetdir):
+	summary = loadUserSummary(username, tweetdir)
+	if( "newest" in summary ):
+		return summary["newest"]
+	# Summarized before we kept IDs, so check the tweets themselves
+	ids = [tweetID(t) for t in iterTweetsFromFile(username, tweetdir) if tweetID(t) != None]
+	if( len(ids) == 0 ):
+		return None
+	return max(ids)
 
-# Parse user tweets, return [[people they mentioned], [people they retweeted]]
-# Maximum length of either list is `maxreferences` (default: no limit)
+# Brings the tweets we have for a user up to date, only downloading tweets
+# newer than the newest one we have, and adding them to the ones we had.
+# Users with no new tweets aren't touched, so their summaries stay valid.
+# Tweets saved without IDs can't be refreshed that way, so we download those
+# users' timelines again. The tweets are saved in the format asked for,
+# replacing the user's old file if it was in another format.
+def refreshUserTweets(api, username, tweetdir, numtweets, compression, binary=False):
+	newest = newestTweetID(username, tweetdir)
+	oldFilename = None
+	if( not tweetarchive.isArchive(tweetdir) ):
+		oldFilename = userTweetsFilename(username, tweetdir)
+	if( newest == None ):
+		metrics.count("refreshFull")
+		tweets = fetchUserTweets(api, username, numtweets)
+		if( len(tweets) == 0 ):
+			return # Gone private or missing, so keep what we had
+	else:
+		newTweets = fetchUserTweets(api, username, numtweets, newest)
+		if( len(newTweets) == 0 ):
+			metrics.count("refreshUnchanged")
+			return
+		metrics.count("refreshUpdated")
+		with metrics.timer("decode"):
+			tweets = newTweets + list(iterTweetsFromFile(username, tweetdir))
+	with metrics.timer("save"):
+		saveTweetsToFile(username, tweets, tweetdir, compression, binary)
+	if( oldFilename != None and oldFilename != userTweetsFilename(username, tweetdir) ):
+		os.unlink(oldFilename)
+
+# Returns the `limit` users referenced most from {username: count}, keeping
+# the order they came in. Ties go to the alphabetically first username, so
+# the same tweets always keep the same references.
+def strongestReferences(references, limit):
+	if( len(references) <= limit ):
+		return references
+	strongest = set([u for (u, count) in heapq.nsmallest(limit, references.items(), key=lambda item: (-item[1], item[0]))])
+	return dict([(u, count) for (u, count) in references.items() if u in strongest])
+
+# Parse user tweets, return [[people they mentioned], [people they retweeted],
+# how many tweets they have]. Each list keeps only the `maxreferences` users referenced most (default: no
+# limit), so a limited crawl still follows a user's strongest connections.
 def getUserReferences(username, tweetdir, maxreferences=float('inf')):
-	tweets = loadTweetsFromFile(username, tweetdir)
-	retweeted = defaultdict(lambda: 0)
-	mentioned = defaultdict(lambda: 0)
-	for tweet in tweets:
-		if( isinstance(tweet, Retweet) and len(retweeted) < maxreferences ):
-			retweeted[tweet.source] += 1
-		else:
-			for user in tweet.mentions:
-				if( len(mentioned) < maxreferences ):
-					mentioned[user] += 1
-	return [mentioned, retweeted]
+	summary = loadUserSummary(username, tweetdir)
+	mentioned = defaultdict(lambda: 0, strongestReferences(summary["mentions"], maxreferences))
+	retweeted = defaultdict(lambda: 0, strongestReferences(summary["retweets"], maxreferences))
+	return [mentioned, retweeted, summary["tweets"]]
 
 def deleteUserTweets(username, tweetdir):
-	os.unlink(tweetdir + "/" + username + ".json")
+	if( tweetarchive.isArchive(tweetdir) ):
+		tweetarchive.openArchive(tweetdir).delete(username)
+		return
+	os.unlink(userTweetsFilename(username, tweetdir))
+	if( os.path.isfile(summaryFilename(username, tweetdir)) ):
+		os.unlink(summaryFilename(username, tweetdir))
 
+# Saves a dictionary of username -> {username: count}, or anything else with
+# items() like one (see crawlstate.References). It's written a user at a
+# time, so the whole thing never has to be in memory as a dictionary.
 def saveUserList(workdir, name, dictionary):
-	blob = json.dumps(dictionary)
 	f = open(workdir + "/" + name + ".json", "w")
-	f.write(blob)
+	f.write("{")
+	first = True
+	for (username, referenced) in dictionary.items():
+		if( not first ):
+			f.write(", ")
+		f.write(json.dumps(username) + ": " + json.dumps(referenced))
+		first = False
+	f.write("}")
 	f.close()
 
 def loadUserList(workdir, name):
@@ -150,35 +429,449 @@ def flattenUserDictionary(links):
 			res.add(linkedTo)
 	return res
 
-def getLayers(api, numLayers, options, userlist, olduserlist=set()):
+# Downloads tweets for the users a crawl is about to reach, using a pool of
+# worker threads. Users are queued, as user numbers, in the order we'll get
+# to them, but only `window` downloads (two per worker) run at once, and at
+# most AHEAD windows' worth wait for the crawl to get to them. More are
+# started as downloads finish, so a layer of millions of users doesn't need
+# a future for each of them.
+# We start downloads for users we don't have yet, or with --refresh, users we
+# have that aren't in `refreshed` (user numbers refreshed earlier in the
+# crawl, which is updated). Without a pool, nothing is started.
+# Whether we have a user's tweets is looked up CHECK_SIZE users at a time
+# (see presentUsers), a query per batch for archives, and remembered.
+AHEAD = 8
+CHECK_SIZE = 500
+
+class Downloads(object):
+	def __init__(self, pool, api, options, names, refreshed, budget):
+		self.pool = pool
+		self.api = api
+		self.options = options
+		self.names = names
+		self.refreshed = refreshed
+		self.budget = budget
+		self.window = options.workers * 2 if pool else 0
+		self.pending = dict() # Username -> future
+		self.queue = deque() # [depth, user numbers, how many we've looked at, how many we've checked]
+		self.started = crawlstate.UserFlags()
+		self.checked = crawlstate.UserFlags()
+		self.stored = crawlstate.UserFlags()
+		self.functions = dict()
+
+	# Throws away the queue and queues a layer's users (at `depth`) instead
+	def restart(self, depth, users):
+		self.queue.clear()
+		self.extend(depth, users)
+
+	# Queues more users, after those already queued
+	def extend(self, depth, users):
+		if( self.pool ):
+			self.queue.append([depth, users, 0, 0])
+
+	# Looks up which of a list of user numbers we have tweets for, skipping
+	# any we already know about
+	def check(self, users):
+		unchecked = [userID for userID in users if not userID in self.checked]
+		if( len(unchecked) == 0 ):
+			return
+		present = presentUsers([self.names.name(userID) for userID in unchecked], self.options.tweetdir)
+		for userID in unchecked:
+			self.checked.add(userID)
+			if( self.names.name(userID) in present ):
+				self.stored.add(userID)
+
+	# Returns whether we have a user's tweets, looking them up on their own
+	# if they weren't checked with a batch
+	def present(self, userID):
+		if( not userID in self.checked ):
+			self.check([userID])
+		return userID in self.stored
+
+	# Records that we now have a user's tweets
+	def downloaded(self, userID):
+		self.checked.add(userID)
+		self.stored.add(userID)
+
+	# The download functions for a layer, with a profiling stage of their own
+	# (see profiling), skipped once our budget is spent
+	def function(self, depth, function):
+		key = (depth, function)
+		if( not key in self.functions ):
+			self.functions[key] = self.budget.guard(profiling.profiled("layer" + str(depth) + "-download")(function))
+		return self.functions[key]
+
+	# Starts a user's download now if they need one and we haven't already.
+	# Returns whether we started one.
+	def start(self, userID, depth):
+		if( self.pool == None or userID in self.started ):
+			return False
+		self.started.add(userID)
+		username = self.names.name(userID)
+		options = self.options
+		if( not self.present(userID) ):
+			# Just downloaded, so there's nothing newer to refresh
+			self.refreshed.add(userID)
+			function = self.function(depth, getUserTweets)
+		elif( options.refresh and not userID in self.refreshed ):
+			self.refreshed.add(userID)
+			function = self.function(depth, refreshUserTweets)
+		else:
+			return False
+		self.pending[username] = self.pool.submit(function, self.api, username, options.tweetdir, options.numtweets, options.compress, options.binary)
+		return True
+
+	def running(self):
+		return [future for future in self.pending.values() if not future.done()]
+
+	# Starts downloads from the queue until the window is full
+	def fill(self):
+		running = len(self.running())
+		while( running < self.window and len(self.pending) < self.window * AHEAD and len(self.queue) > 0 and not self.budget.spent() ):
+			entry = self.queue[0]
+			(depth, users, done, checked) = entry
+			if( done >= len(users) ):
+				self.queue.popleft()
+				continue
+			if( done >= checked ):
+				entry[3] = done + CHECK_SIZE
+				self.check(users[done:entry[3]])
+			entry[2] = done + 1
+			if( self.start(users[done], depth) ):
+				running += 1
+
+	# Waits for a user's download if one was started, starting more as others
+	# finish. Returns whether the download ran (not if it was skipped for lack
+	# of budget), or None if there wasn't one.
+	def take(self, username):
+		future = self.pending.pop(username, None)
+		if( future == None ):
+			return None
+		while( not future.done() ):
+			wait([future] + self.running(), return_when=FIRST_COMPLETED)
+			self.fill()
+		self.fill()
+		ran = future.result()
+		if( ran ):
+			self.downloaded(self.names.id(username))
+		return ran
+
+	def cancel(self):
+		for future in self.pending.values():
+			future.cancel()
+		self.pending.clear()
+		self.queue.clear()
+
+# How many API calls (--budget-calls) and seconds (--budget-seconds) a crawl
+# may spend. Once either runs out we stop starting downloads; ones already
+# underway are allowed to finish, so a crawl can go a little over.
+class Budget(object):
+	def __init__(self, calls=None, seconds=None):
+		self.calls = calls
+		self.seconds = seconds
+		self.startCalls = metrics.counters.get("apiCalls", 0)
+		self.start = time.time()
+
+	def spent(self):
+		if( self.calls != None and metrics.counters.get("apiCalls", 0) - self.startCalls >= self.calls ):
+			return True
+		return self.seconds != None and time.time() - self.start >= self.seconds
+
+	# Wraps a download so it's skipped once the budget is spent. The wrapper
+	# returns whether it ran.
+	def guard(self, function):
+		def guarded(*args, **kwargs):
+			if( self.spent() ):
+				return False
+			function(*args, **kwargs)
+			return True
+		return guarded
+
+# Makes sure we have a user's tweets, waiting on their download if one was
+# started, otherwise downloading or refreshing them as needed. Returns False
+# if that needed API calls our budget doesn't have left.
+def crawlUser(api, username, options, names, refreshed, downloads, budget):
+	userID = names.id(username)
+	downloaded = downloads.take(username)
+	if( downloaded != None ):
+		return downloaded
+	if( not downloads.present(userID) ):
+		ran = budget.guard(getUserTweets)(api, username, options.tweetdir, options.numtweets, options.compress, options.binary)
+		if( ran ):
+			downloads.downloaded(userID)
+			refreshed.add(userID)
+		return ran
+	if( options.refresh and not userID in refreshed ):
+		if( budget.spent() ):
+			return False
+		refreshed.add(userID)
+		refreshUserTweets(api, username, options.tweetdir, options.numtweets, options.compress, options.binary)
+		return True
+	metrics.count("cacheHits")
+	return True
+
+# Yields a layer's users in list order, looking up which of them we have
+# tweets for a batch at a time (see Downloads.check)
+def inOrder(users, names, downloads):
+	for i in range(0, len(users), CHECK_SIZE):
+		batch = users[i:i+CHECK_SIZE]
+		downloads.check(batch)
+		for userID in batch:
+			yield names.name(userID)
+
+# Yields a layer's users most referenced first (see crawlstate.Priorities),
+# for --priority. The order can change every time a user is crawled, so with
+# a pool we only start downloads a couple of users per worker ahead of the
+# user being crawled.
+def prioritized(users, priorities, options, layer, names, downloads):
+	for i in range(0, len(users), CHECK_SIZE):
+		batch = users[i:i+CHECK_SIZE]
+		downloads.check(batch)
+		for userID in batch:
+			priorities.push(userID)
+	ahead = deque()
+	lookahead = max(downloads.window, 1)
+	while( len(priorities) > 0 or len(ahead) > 0 ):
+		while( len(ahead) < lookahead and len(priorities) > 0 ):
+			userID = priorities.pop()
+			ahead.append(names.name(userID))
+			if( not downloads.budget.spent() ):
+				downloads.start(userID, layer)
+		yield ahead.popleft()
+
+# Queues the users a crawled user references for download, for --stream.
+# They belong to the next layer, `depth`, unless an earlier layer already
+# has them, so we only queue users we haven't come across before. The layer
+# they're in still waits for the one before it to finish, but their
+# downloads don't, so the workers always have something to do.
+def prefetch(options, depth, names, discovered, downloads, mentions, rts):
+	found = array("I")
+	for (ignored, references) in [(options.ignoreretweets, rts), (options.ignorementions, mentions)]:
+		if( ignored ):
+			continue
+		for username in references:
+			userID = names.id(username)
+			if( not userID in discovered ):
+				discovered.add(userID)
+				found.append(userID)
+	if( len(found) > 0 ):
+		metrics.count("prefetched", len(found))
+		downloads.extend(depth, found)
+		downloads.fill()
+
+# Adds a crawled user's references to the weights of the users they reference
+def addWeights(priorities, names, options, mentions, rts):
+	if( not options.ignorementions ):
+		for (username, count) in mentions.items():
+			priorities.add(names.id(username), count)
+	if( not options.ignoreretweets ):
+		for (username, count) in rts.items():
+			priorities.add(names.id(username), count)
+
+# Reads a layer's references back from the user lists we saved
+def loadReferences(workdir, name, names, spillDir):
+	references = crawlstate.References(names, spillDir)
+	for (username, referenced) in loadUserList(workdir, name).items():
+		references.add(username, referenced)
+	return references
+
+# Crawls numLayers layers out from userlist, saving a map after each layer.
+# The map is kept in memory for the whole crawl, or picked up from `network`
+# (see analyze.NetworkBuilder.load) when continuing an earlier crawl. Users
+# in `olduserlist` are treated as already visited.
+# Progress is journaled in the workdir (see journal), and with --resume we
+# carry on from the journal of an interrupted crawl, first clearing away any
+# half-written files it left in the tweetdir.
+# Users and references are kept compactly (see crawlstate), and with
+# --spill references are kept on disk in the workdir until they're needed.
+# With --priority, each layer's most referenced users are crawled first (see
+# prioritized), and with --budget-calls or --budget-seconds the crawl stops
+# partway through a layer once its budget is spent (see Budget). That layer's
+# user lists and map are saved with the users we got to, but it isn't marked
+# done in the journal, so --resume with more budget carries on with it.
+# With --stream (and more than one worker), users are downloaded as soon as
+# they're found rather than when their layer starts (see prefetch). Layers
+# are still put together one at a time, in the same order, so the maps and
+# journal come out as they would without it.
+# Returns the number of users visited.
+def getLayers(api, numLayers, options, userlist, olduserlist=None, network=None):
+	spillDir = options.workdir if options.spill else None
+	names = crawlstate.Usernames()
+	visited = crawlstate.UserFlags()
+	refreshed = crawlstate.UserFlags()
+	priorities = crawlstate.Priorities()
+	discovered = crawlstate.UserFlags()
+	budget = Budget(options.budgetcalls, options.budgetseconds)
+	for username in (olduserlist or []):
+		visited.add(names.id(username))
+	progress = journal.Journal(options.workdir, options.resume)
+	firstLayer = progress.nextLayer()
+	if( firstLayer > 0 or len(progress.visited()) > 0 ):
+		log.log(log.info, "Resuming crawl at layer " + str(firstLayer) + ", " + str(len(progress.visited())) + " users already done")
+	if( options.resume ):
+		removed = removeTemporaryFiles(options.tweetdir)
+		if( removed > 0 ):
+			log.log(log.info, "Removed " + str(removed) + " temporary files left by the interrupted crawl")
+	if( firstLayer > 0 and network == None ):
+		network = analyze.NetworkBuilder.load(options.mapdir + "/layer" + str(firstLayer) + ".gml")
+	if( network == None ):
+		network = analyze.NetworkBuilder()
+	for username in progress.visited():
+		visited.add(names.id(username))
+		refreshed.add(names.id(username))
+	pool = None
+	if( options.workers > 1 ):
+		pool = ThreadPoolExecutor(max_workers=options.workers)
+	streaming = options.stream and pool != None
+	# Downloads for users we haven't got to yet, which with --stream can
+	# include users of the next layer
+	downloads = Downloads(pool, api, options, names, refreshed, budget)
+	# The previous layer's references, which make up this layer's users
+	lastRTs = None
+	lastMentions = None
+	# Each layer's users as an array of user numbers (see crawlstate)
+	users = array("I", [names.id(username) for username in userlist])
+	try:
+		for layer in range(firstLayer, numLayers):
+			if( budget.spent() ):
+				log.log(log.warn, "Crawl budget spent, stopping before layer " + str(layer))
+				break
+			log.log(log.info, "Beginning data collection for layer " + str(layer))
+			if( layer > 0 ):
+				if( lastRTs == None ):
+					lastRTs = loadReferences(options.workdir, "layer" + str(layer-1) + "retweetedUsers", names, spillDir)
+					lastMentions = loadReferences(options.workdir, "layer" + str(layer-1) + "mentionedUsers", names, spillDir)
+				users = crawlstate.frontier(names, lastRTs, lastMentions)
+				lastRTs.close()
+				lastMentions.close()
+			nextLayerRTs = crawlstate.References(names, spillDir)
+			nextLayerMentions = crawlstate.References(names, spillDir)
+			tweetCounts = crawlstate.TweetCounts(names)
+			# Users finished before the crawl was interrupted
+			resumed = progress.layerUsers(layer)
+			for userID in users:
+				discovered.add(userID)
+			if( options.priority ):
+				downloads.restart(layer, array("I"))
+				order = prioritized(users, priorities, options, layer, names, downloads)
+			else:
+				# Users are processed in list order, so the layer files come out
+				# the same as a single-threaded run
+				order = inOrder(users, names, downloads)
+				downloads.restart(layer, users)
+				downloads.fill()
+			# Profiling stages for this layer (see profiling). With worker
+			# threads, crawling is mostly waiting on their downloads.
+			crawlStage = "layer" + str(layer) + "-crawl"
+			referenceStage = "layer" + str(layer) + "-references"
+			complete = True
+			for username in order:
+				userID = names.id(username)
+				if( username in resumed ):
+					(tweets, mentions, rts) = resumed.pop(username)
+				else:
+					with profiling.stage(crawlStage):
+						complete = crawlUser(api, username, options, names, refreshed, downloads, budget)
+					if( not complete ):
+						break
+					if( userID in visited ):
+						continue
+					visited.add(userID)
+					with profiling.stage(referenceStage):
+						mentions, rts, tweets = getUserReferences(username, options.tweetdir, options.maxreferences)
+					progress.userDone(layer, username, tweets, dict(mentions), dict(rts))
+				tweetCounts.add(username, tweets)
+				nextLayerRTs.add(username, rts)
+				nextLayerMentions.add(username, mentions)
+				if( options.priority ):
+					addWeights(priorities, names, options, mentions, rts)
+				if( streaming and layer + 1 < numLayers ):
+					prefetch(options, layer + 1, names, discovered, downloads, mentions, rts)
+			if( not complete ):
+				log.log(log.warn, "Crawl budget spent partway through layer " + str(layer) + ", saving the " + str(len(tweetCounts)) + " users we got to")
+				downloads.cancel()
+			if( options.ignoreretweets ):
+				nextLayerRTs.close()
+			if( options.ignorementions ):
+				nextLayerMentions.close()
+			log.log(log.info, "Layer " + str(layer) + " data collection complete, saving user lists...")
+			with profiling.stage("layer" + str(layer) + "-save"):
+				saveUserList(options.workdir, "layer" + str(layer) + "mentionedUsers", nextLayerMentions)
+				saveUserList(options.workdir, "layer" + str(layer) + "retweetedUsers", nextLayerRTs)
+				log.log(log.info, "Saving network to disk...")
+				network.addLayer(layer, tweetCounts, nextLayerRTs, nextLayerMentions)
+				network.save(options.mapdir, layer)
+			lastRTs = nextLayerRTs
+			lastMentions = nextLayerMentions
+			if( not complete ):
+				break
+			progress.layerDone(layer)
+	except BaseException:
+		# Interrupted, perhaps by Control-C (see socmap.sigExit), so drop the
+		# downloads still queued rather than making the exit wait on them
+		if( pool ):
+			pool.shutdown(wait=False, cancel_futures=True)
+		raise
+	if( pool ):
+		pool.shutdown()
+	progress.close()
+	if( lastRTs != None ):
+		lastRTs.close()
+		lastMentions.close()
+	return len(visited)
+
+# Maps rebuildMaps can make from a tweetdir, and which references each one
+# follows, as (retweets, mentions)
+mapKinds = {"mentions": (False, True), "retweets": (True, False), "combined": (True, True)}
+
+# Returns (username, (tweets, mentions, retweets)) from a user's summary, or
+# (username, None) if we don't have their tweets. Run in worker processes.
+def readUserSummary(args):
+	(username, tweetdir) = args
+	if( not userTweetsPresent(username, tweetdir) ):
+		return (username, None)
+	summary = loadUserSummary(username, tweetdir)
+	return (username, (summary["tweets"], summary["mentions"], summary["retweets"]))
+
+# Rebuilds maps from tweets we've already downloaded, the way getLayers
+# would have built them, skipping users we don't have tweets for. Returns
+# {kind: NetworkBuilder} for each kind in `kinds` (see mapKinds).
+# Every kind is built from one pass over the tweetdir: each layer, users any
+# of the maps has reached are read once, spread over `pool` (a
+# multiprocessing pool) if there is one.
+def rebuildMaps(seeds, tweetdir, numLayers, kinds, pool=None):
+	references = dict()
+	names = crawlstate.Usernames()
+	networks = dict([(kind, analyze.NetworkBuilder()) for kind in kinds])
+	userlists = dict([(kind, list(seeds)) for kind in kinds])
+	olduserlists = dict([(kind, crawlstate.UserFlags()) for kind in kinds])
 	for layer in range(0, numLayers):
-		log.log(log.info, "Beginning data collection for layer " + str(layer))
-		if( layer > 0 ):
-			oldRTs = loadUserList(options.workdir, "layer" + str(layer-1) + "retweetedUsers")
-			oldMentions = loadUserList(options.workdir, "layer" + str(layer-1) + "mentionedUsers")
-			rtUsernames = flattenUserDictionary(oldRTs)
-			mentionUsernames = flattenUserDictionary(oldMentions)
-			userlist = list(rtUsernames.union(mentionUsernames))
-		nextLayerRTs = dict()
-		nextLayerMentions = dict()
-		tweetCounts = dict()
-		for username in userlist:
-			if( not userTweetsPresent(username, options.tweetdir) ):
-				getUserTweets(api, username, options.tweetdir, options.numtweets, options.compress)
-			if( not username in olduserlist ):
-				olduserlist.add(username)
-				mentions, rts = getUserReferences(username, options.tweetdir, options.maxreferences)
-				tweetCounts[username] = len(loadTweetsFromFile(username, options.tweetdir))
-				if( len(rts) > 0 ):
-					nextLayerRTs[username] = dict(rts)
-				if( len(mentions) > 0 ):
-					nextLayerMentions[username] = dict(mentions)
-		if( options.ignoreretweets ):
-			nextLayerRTs.clear()
-		if( options.ignorementions ):
-			nextLayerMentions.clear()
-		log.log(log.info, "Layer " + str(layer) + " data collection complete, saving user lists...")
-		saveUserList(options.workdir, "layer" + str(layer) + "mentionedUsers", nextLayerMentions)
-		saveUserList(options.workdir, "layer" + str(layer) + "retweetedUsers", nextLayerRTs)
-		log.log(log.info, "Saving network to disk...")
-		analyze.saveNetwork(options.mapdir, layer, tweetCounts, nextLayerRTs, nextLayerMentions)
+		needed = set()
+		for kind in kinds:
+			needed.update([u for u in userlists[kind] if not u in references])
+		log.log(log.info, "Layer " + str(layer) + ": reading data on " + str(len(needed)) + " users")
+		jobs = [(username, tweetdir) for username in needed]
+		if( pool != None ):
+			results = pool.imap_unordered(readUserSummary, jobs, chunksize=64)
+		else:
+			results = map(readUserSummary, jobs)
+		for (username, found) in results:
+			references[username] = found
+		for kind in kinds:
+			(followRTs, followMentions) = mapKinds[kind]
+			tweetCounts = crawlstate.TweetCounts(names)
+			nextLayerRTs = crawlstate.References(names)
+			nextLayerMentions = crawlstate.References(names)
+			for username in userlists[kind]:
+				if( references[username] == None or names.id(username) in olduserlists[kind] ):
+					continue
+				olduserlists[kind].add(names.id(username))
+				(tweets, mentions, rts) = references[username]
+				tweetCounts.add(username, tweets)
+				if( followRTs ):
+					nextLayerRTs.add(username, rts)
+				if( followMentions ):
+					nextLayerMentions.add(username, mentions)
+			networks[kind].addLayer(layer, tweetCounts, nextLayerRTs, nextLayerMentions)
+			userlists[kind] = [names.name(u) for u in crawlstate.frontier(names, nextLayerRTs, nextLayerMentions)]
+	return networks
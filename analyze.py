@@ -1,7 +1,6 @@
 #!/usr/bin/env python3
 
-import re,sys
-from shutil import copyfile
+import os,sys
 try:
 	import igraph as ig
 	has_igraph = True
@@ -11,7 +10,7 @@ except ImportError:
 except ImportError:
 	sys.stderr.write("ERROR: Module requires either igraph (preferred) or networkx (slower)")
 	sys.exit(1)
-import log
+import log, mapformat, gml, metrics, profiling
 
 # When igraph writes to GML, it saves the ids as floats
 # When it reads this data back in, it creates an extra "id"
@@ -28,271 +27,407 @@ def igraphReadGML(filename):
 
 # NetworkX produces GML files that include a numeric 'label' attribute.
 # This attribute prevents Cytoscape from opening the files, so we'll patch it.
+# We now write Cytoscape files directly (see gml), this is for older files.
 def patchGML(filename):
-	with open(filename, "r+") as f:
-		content = f.read()
-		newcontent = re.sub("label (\S+)\s+", r'', content)
-		f.seek(0, 0)
-		f.truncate()
-		f.write(newcontent)
+	gml.patchGMLFile(filename, filename + ".tmp")
+	os.replace(filename + ".tmp", filename)
 
-def saveNetwork(mapDir, layer, baseUsers, retweeted, mentioned):
-	net = None
-	oldMapFilename = None
-	newMapFilename = mapDir + "/layer" + str(layer+1) + ".gml"
-	newMapFilenameCytoscape = mapDir + "/layer" + str(layer+1) + "_cytoscape.gml"
-	if( layer > 0 ):
-		oldMapFilename = mapDir + "/layer" + str(layer) + ".gml"
+# Maps can be stored as GML, or in our binary format (see mapformat), picked by
+# file extension. readNetwork and writeNetwork handle either, using igraph if
+# we have it and NetworkX otherwise. Tools written against one library can
+# ask for it with useIgraph.
+@profiling.profiled("readNetwork")
+def readNetwork(filename, useIgraph=None):
+	if( useIgraph == None ):
+		useIgraph = has_igraph
+	if( useIgraph and not has_igraph ):
+		raise ImportError("igraph is required to load " + filename + " here")
+	if( mapformat.isMapFile(filename) ):
+		return readMapFile(filename, useIgraph)
+	if( useIgraph ):
+		return igraphReadGML(filename)
+	import networkx as nx
+	return nx.read_gml(filename)
 
-	# For layer 0 we need to explicitly create seed nodes
-	users = dict()
-	baseUserList = list(baseUsers.keys())
-	if( layer == 0 ):
-		if( has_igraph ):
-			net = ig.Graph(directed=True)
-			net.add_vertices(len(baseUserList))
-			for i in range(0, len(baseUserList)):
-				username = baseUserList[i]
-				net.vs[i]["name"] = username
-				# NetworkX won't read our GML files unless we include a "label"
-				net.vs[i]["label"] = username
-				net.vs[i]["layer"] = 0
-				net.vs[i]["retweeted"] = "false"
-				net.vs[i]["mentioned"] = "false"
-				net.vs[i]["tweets"] = baseUsers[username]
-		else:
-			net = nx.DiGraph()
-			for username in baseUserList:
-				net.add_node(username, name=username, layer=0, retweeted="false", mentioned="false", tweets=baseUsers[username])
+# With `cytoscape`, NetworkX GML files are also written in a
+# Cytoscape-compatible version, as <filename>_cytoscape.gml
+@profiling.profiled("writeNetwork")
+def writeNetwork(net, filename, cytoscape=False):
+	useIgraph = has_igraph and isinstance(net, ig.Graph)
+	if( mapformat.isMapFile(filename) ):
+		writeMapFile(net, filename, useIgraph)
+	elif( useIgraph ):
+		net.write_gml(filename)
 	else:
-		# Load old network, update tweet counts for users we now have data on
-		if( has_igraph ):
-			net = igraphReadGML(oldMapFilename)
-			for username in baseUserList:
-				net.vs.select(name_eq=username)[0]["tweets"] = baseUsers[username]
-		else:
-			net = nx.read_gml(oldMapFilename)
-			for username in baseUserList:
-				net.nodes[username]["tweets"] = baseUsers[username]
+		gml.writeGML(net, filename, filename + "_cytoscape.gml" if cytoscape else None)
 
-	# Now let's add the new users
-	mentionedUsernames = set()
-	retweetedUsernames = set()
-	if( has_igraph ):
-		nodeNames = set(net.vs.select()["name"])
+def readMapFile(filename, useIgraph):
+	m = mapformat.MapFile(filename)
+	names = m.allNames()
+	layers = list(m.layer)
+	tweets = list(m.tweets)
+	retweeted = ["true" if f & mapformat.RETWEETED else "false" for f in m.flags]
+	mentioned = ["true" if f & mapformat.MENTIONED else "false" for f in m.flags]
+	sources = m.sources()
+	targets = list(m.target)
+	retweets = list(m.retweets)
+	mentions = list(m.mentions)
+	m.close()
+	if( useIgraph ):
+		# NetworkX won't read our GML files unless we include a "label"
+		vertexAttributes = {"name": names, "label": names, "layer": layers,
+		                    "retweeted": retweeted, "mentioned": mentioned, "tweets": tweets}
+		edgeAttributes = {"retweets": retweets, "mentions": mentions}
+		return ig.Graph(n=len(names), edges=list(zip(sources, targets)), directed=True,
+		                vertex_attrs=vertexAttributes, edge_attrs=edgeAttributes)
+	import networkx as nx
+	net = nx.DiGraph()
+	net.add_nodes_from([(names[i], {"name": names[i], "layer": layers[i], "retweeted": retweeted[i], "mentioned": mentioned[i], "tweets": tweets[i]}) for i in range(0, len(names))])
+	net.add_edges_from([(names[sources[i]], names[targets[i]], {"retweets": retweets[i], "mentions": mentions[i]}) for i in range(0, len(targets))])
+	return net
+
+def writeMapFile(net, filename, useIgraph):
+	if( useIgraph ):
+		names = net.vs["name"]
+		columns = dict([(a, net.vs[a]) for a in ["layer", "tweets", "retweeted", "mentioned"]])
+		attributes = [dict([(a, columns[a][i]) for a in columns]) for i in range(0, len(names))]
+		edgeList = net.get_edgelist()
+		retweets = net.es["retweets"] if len(edgeList) > 0 else []
+		mentions = net.es["mentions"] if len(edgeList) > 0 else []
+		edges = [(edgeList[i][0], edgeList[i][1], int(retweets[i]), int(mentions[i])) for i in range(0, len(edgeList))]
 	else:
-		nodeNames = set(net.nodes())
-	# Get a set of all the usernames we'll be working with
-	for srcUser in retweeted.keys():
-		rts = retweeted[srcUser]
-		for dstUser in rts:
-			if( dstUser not in nodeNames ):
-				retweetedUsernames.add(dstUser)
-	for srcUser in mentioned.keys():
-		rts = mentioned[srcUser]
-		for dstUser in rts:
-			if( dstUser not in nodeNames ):
-				mentionedUsernames.add(dstUser)
-	# Now add those usernames with appropriate retweeted/mentioned attributes
-	for username in mentionedUsernames:
-		if( username in nodeNames ):
-			continue
-		if( username in retweetedUsernames ):
-			if( has_igraph ):
-				net.add_vertex(username)
-				i = net.vs.find(username).index
-				net.vs[i]["name"] = username
-				net.vs[i]["label"] = username
-				net.vs[i]["layer"] = layer+1
-				net.vs[i]["retweeted"] = "true"
-				net.vs[i]["mentioned"] = "true"
-				net.vs[i]["tweets"] = 0
-			else:
-				net.add_node(username, name=username, layer=layer+1, retweeted="true", mentioned="true", tweets=0)
+		names = list(net.nodes())
+		attributes = [net.nodes[n] for n in names]
+		index = dict([(names[i], i) for i in range(0, len(names))])
+		edges = [(index[src], index[dst], int(a["retweets"]), int(a["mentions"])) for (src, dst, a) in net.edges(data=True)]
+	flags = []
+	for a in attributes:
+		flag = 0
+		if( a["retweeted"] == "true" ):
+			flag |= mapformat.RETWEETED
+		if( a["mentioned"] == "true" ):
+			flag |= mapformat.MENTIONED
+		flags.append(flag)
+	layers = [int(a["layer"]) for a in attributes]
+	tweets = [int(a["tweets"]) for a in attributes]
+	mapformat.writeMap(filename, names, layers, tweets, flags, edges)
+
+# Builds a map one layer at a time, keeping the graph in memory between
+# layers so a crawl doesn't have to re-read the previous layer's GML file.
+# After each layer, save() writes a snapshot of the map so far.
+class NetworkBuilder(object):
+	def __init__(self, net=None):
+		self.net = net
+		# igraph works in vertex indices, so keep a map from usernames
+		self.index = dict()
+		if( net != None and has_igraph ):
+			for i, name in enumerate(net.vs["name"]):
+				self.index[name] = i
+
+	# Picks up a map from an earlier layer's snapshot, for resuming a crawl
+	@classmethod
+	def load(cls, filename):
+		return cls(readNetwork(filename))
+
+	def hasUser(self, username):
+		if( has_igraph ):
+			return username in self.index
+		return username in self.net
+
+	# Adds users in bulk. `users` is a list of (username, layer, retweeted,
+	# mentioned, tweets)
+	def addUsers(self, users):
+		if( len(users) == 0 ):
+			return
+		if( has_igraph ):
+			first = len(self.net.vs)
+			names = [u[0] for u in users]
+			# NetworkX won't read our GML files unless we include a "label"
+			self.net.add_vertices(len(users), attributes={
+				"name": names,
+				"label": names,
+				"layer": [u[1] for u in users],
+				"retweeted": [u[2] for u in users],
+				"mentioned": [u[3] for u in users],
+				"tweets": [u[4] for u in users]})
+			for i, name in enumerate(names):
+				self.index[name] = first + i
 		else:
-			if( has_igraph ):
-				net.add_vertex(username)
-				i = net.vs.find(username).index
-				net.vs[i]["name"] = username
-				net.vs[i]["label"] = username
-				net.vs[i]["layer"] = layer+1
-				net.vs[i]["retweeted"] = "false"
-				net.vs[i]["mentioned"] = "true"
-				net.vs[i]["tweets"] = 0
-			else:
-				net.add_node(username, name=username, layer=layer+1, retweeted="false", mentioned="true", tweets=0)
-		nodeNames.add(username)
-	for username in retweetedUsernames:
-		if( username in nodeNames ):
-			continue
+			self.net.add_nodes_from([(u[0], {"name": u[0], "layer": u[1], "retweeted": u[2], "mentioned": u[3], "tweets": u[4]}) for u in users])
+
+	# Sets tweet counts in bulk from a dictionary of username -> tweets
+	def setTweetCounts(self, tweetCounts):
 		if( has_igraph ):
-			net.add_vertex(username)
-			i = net.vs.find(username).index
-			net.vs[i]["name"] = username
-			net.vs[i]["label"] = username
-			net.vs[i]["layer"] = layer+1
-			net.vs[i]["retweeted"] = "true"
-			net.vs[i]["mentioned"] = "false"
-			net.vs[i]["tweets"] = 0
+			tweets = self.net.vs["tweets"]
+			for (username, count) in tweetCounts.items():
+				tweets[self.index[username]] = count
+			self.net.vs["tweets"] = tweets
 		else:
-			net.add_node(username, name=username, layer=layer+1, retweeted="true", mentioned="false", tweets=0)
-		nodeNames.add(username)
+			for (username, count) in tweetCounts.items():
+				self.net.nodes[username]["tweets"] = count
 
-	# Next, let's add the edges
-	for srcUser in retweeted.keys():
-		rts = retweeted[srcUser].keys()
-		for dstUser in rts:
-			if( has_igraph ):
-				srcID = net.vs.find(name=srcUser).index
-				dstID = net.vs.find(name=dstUser).index
-				# Only add edge if it doesn't exist
-				edgeID = net.get_eid(srcID,dstID,directed=True,error=False)
-				if( edgeID == -1 ):
-					net.add_edge(srcID,dstID,retweets=retweeted[srcUser][dstUser],mentions=0)
+	# Adds or updates edges in bulk. `edges` is a dictionary of
+	# (src, dst) -> {"retweets": n, "mentions": n}, where either key may be
+	# missing. New edges default to zero for a missing key, existing edges
+	# keep their old value.
+	def setEdges(self, edges):
+		pairs = list(edges.keys())
+		if( len(pairs) == 0 ):
+			return
+		if( has_igraph ):
+			net = self.net
+			ids = [(self.index[src], self.index[dst]) for (src, dst) in pairs]
+			eids = net.get_eids(pairs=ids, directed=True, error=False)
+			newIDs = []
+			newRTs = []
+			newMentions = []
+			updates = []
+			for i in range(0, len(pairs)):
+				weights = edges[pairs[i]]
+				if( eids[i] == -1 ):
+					newIDs.append(ids[i])
+					newRTs.append(weights.get("retweets", 0))
+					newMentions.append(weights.get("mentions", 0))
 				else:
-					net.es[edgeID]["retweets"] = retweeted[srcUser][dstUser]
-			else:
-				if( net.has_edge(srcUser, dstUser) ):
-					net[srcUser][dstUser]["retweets"] = retweeted[srcUser][dstUser]
+					updates.append((eids[i], weights))
+			if( len(updates) > 0 ):
+				retweets = net.es["retweets"]
+				mentions = net.es["mentions"]
+				for (eid, weights) in updates:
+					retweets[eid] = weights.get("retweets", retweets[eid])
+					mentions[eid] = weights.get("mentions", mentions[eid])
+				net.es["retweets"] = retweets
+				net.es["mentions"] = mentions
+			net.add_edges(newIDs, attributes={"retweets": newRTs, "mentions": newMentions})
+		else:
+			net = self.net
+			newEdges = []
+			for (src, dst) in pairs:
+				weights = edges[(src, dst)]
+				if( net.has_edge(src, dst) ):
+					net[src][dst].update(weights)
+				elif( "retweets" in weights ):
+					newEdges.append((src, dst, {"retweets": weights["retweets"], "mentions": weights.get("mentions", 0)}))
 				else:
-					net.add_edge(srcUser, dstUser, retweets=retweeted[srcUser][dstUser], mentions=0)
-	for srcUser in mentioned.keys():
-		mts = mentioned[srcUser].keys()
-		for dstUser in mts:
+					newEdges.append((src, dst, {"mentions": weights["mentions"], "retweets": 0}))
+			net.add_edges_from(newEdges)
+
+	# `baseUsers` is a dictionary of username -> tweets for the users read in
+	# this layer, and `retweeted` and `mentioned` dictionaries of username ->
+	# {username: count}. Anything with items() like them works too (see
+	# crawlstate).
+	@metrics.timed("addLayer")
+	def addLayer(self, layer, baseUsers, retweeted, mentioned):
+		# For layer 0 we need to explicitly create seed nodes
+		if( self.net == None ):
 			if( has_igraph ):
-				srcID = net.vs.find(name=srcUser).index
-				dstID = net.vs.find(name=dstUser).index
-				# Only add edge if it doesn't exist
-				edgeID = net.get_eid(srcID,dstID,directed=True,error=False)
-				if( edgeID == -1 ):
-					net.add_edge(srcID,dstID,mentions=mentioned[srcUser][dstUser],retweets=0)
-				else:
-					net.es[edgeID]["mentions"] = mentioned[srcUser][dstUser]
+				self.net = ig.Graph(directed=True)
 			else:
-				if( net.has_edge(srcUser, dstUser) ):
-					net[srcUser][dstUser]["mentions"] = mentioned[srcUser][dstUser]
-				else:
-					net.add_edge(srcUser, dstUser, mentions=mentioned[srcUser][dstUser], retweets=0)
+				self.net = nx.DiGraph()
+			self.addUsers([(u, 0, "false", "false", tweets) for (u, tweets) in baseUsers.items()])
+		else:
+			# Update tweet counts for users we now have data on
+			self.setTweetCounts(baseUsers)
 
-	# Finally save it to disk
-	if( has_igraph ):
-		try:
-			net.write_gml(newMapFilename)
-		except ig._igraph.InternalError:
-			# Sometimes igraph freaks out and won't save as GML
-			# but it saves fine as GraphML, and we can convert
-			msg = "Could not save GML file: We will save a GraphML file and "
-			msg += "what we can export to GML to aid in debugging"
-			log.log(log.warn, msg)
-			net.write_graphml(newMapFilename+".graphml")
-			tmp = ig.Graph.Read_GraphML(newMapFilename+".graphml")
-			tmp.write_gml(newMapFilename)
+		# Now let's add the new users with appropriate retweeted/mentioned
+		# attributes
+		mentionedUsernames = set()
+		retweetedUsernames = set()
+		for (srcUser, targets) in retweeted.items():
+			for dstUser in targets:
+				if( not self.hasUser(dstUser) ):
+					retweetedUsernames.add(dstUser)
+		for (srcUser, targets) in mentioned.items():
+			for dstUser in targets:
+				if( not self.hasUser(dstUser) ):
+					mentionedUsernames.add(dstUser)
+		newUsers = []
+		for username in mentionedUsernames:
+			if( username in retweetedUsernames ):
+				newUsers.append((username, layer+1, "true", "true", 0))
+			else:
+				newUsers.append((username, layer+1, "false", "true", 0))
+		for username in retweetedUsernames:
+			if( not username in mentionedUsernames ):
+				newUsers.append((username, layer+1, "true", "false", 0))
+		self.addUsers(newUsers)
+
+		# Next, let's add the edges
+		edges = dict()
+		for (srcUser, targets) in retweeted.items():
+			for (dstUser, count) in targets.items():
+				edges[(srcUser, dstUser)] = {"retweets": count}
+		for (srcUser, targets) in mentioned.items():
+			for (dstUser, count) in targets.items():
+				weights = edges.setdefault((srcUser, dstUser), dict())
+				weights["mentions"] = count
+		self.setEdges(edges)
+
+	# Writes the map so far as the snapshot for the given layer
+	@metrics.timed("saveNetwork")
+	def save(self, mapDir, layer):
+		net = self.net
+		newMapFilename = mapDir + "/layer" + str(layer+1) + ".gml"
+		newMapFilenameCytoscape = mapDir + "/layer" + str(layer+1) + "_cytoscape.gml"
+		if( has_igraph ):
+			try:
+				net.write_gml(newMapFilename)
+			except ig._igraph.InternalError:
+				# Sometimes igraph freaks out and won't save as GML
+				# but it saves fine as GraphML, and we can convert
+				msg = "Could not save GML file: We will save a GraphML file and "
+				msg += "what we can export to GML to aid in debugging"
+				log.log(log.warn, msg)
+				net.write_graphml(newMapFilename+".graphml")
+				tmp = ig.Graph.Read_GraphML(newMapFilename+".graphml")
+				tmp.write_gml(newMapFilename)
+		else:
+			gml.writeGML(net, newMapFilename, newMapFilenameCytoscape)
+
+# Adds a layer to the map saved in mapDir by the previous layer, and saves
+# the result. Crawls should keep a NetworkBuilder around instead, rather than
+# re-reading the whole map for every layer.
+def saveNetwork(mapDir, layer, baseUsers, retweeted, mentioned):
+	if( layer == 0 ):
+		network = NetworkBuilder()
 	else:
-		nx.write_gml(net, newMapFilename)
-		copyfile(newMapFilename, newMapFilenameCytoscape)
-		patchGML(newMapFilenameCytoscape)
+		network = NetworkBuilder.load(mapDir + "/layer" + str(layer) + ".gml")
+	network.addLayer(layer, baseUsers, retweeted, mentioned)
+	network.save(mapDir, layer)
 
-def combineNetworks(file1, file2, outputfile):
+# Reads a map as plain Python tables, so several maps can be merged without
+# going back and forth between Python and igraph for every node and edge.
+# Returns ([(username, attributes)], [(src username, dst username, attributes)])
+def readMapTables(filename):
+	net = readNetwork(filename)
 	if( has_igraph ):
-		net1 = igraphReadGML(file1)
-		net2 = igraphReadGML(file2)
-	else:
-		net1 = nx.read_gml(file1)
-		net2 = nx.read_gml(file2)
-		outputfileCytoscape = outputfile + "_cytoscape.gml"
+		nodeColumns = dict([(a, net.vs[a]) for a in net.vs.attribute_names()])
+		edgeColumns = dict([(a, net.es[a]) for a in net.es.attribute_names()])
+		names = nodeColumns["name"]
+		nodes = []
+		for i in range(0, len(names)):
+			nodes.append((names[i], dict([(a, c[i]) for (a, c) in nodeColumns.items() if c[i] != None])))
+		edges = []
+		for (i, (src, dst)) in enumerate(net.get_edgelist()):
+			edges.append((names[src], names[dst], dict([(a, c[i]) for (a, c) in edgeColumns.items() if c[i] != None])))
+		return (nodes, edges)
+	return (list(net.nodes(data=True)), list(net.edges(data=True)))
+
+# Merges any number of maps into one, and saves it to outputfile.
+# Users in several maps keep their lowest layer and highest tweet count, and
+# are retweeted or mentioned if they were in any map. Edges keep their highest
+# retweet and mention counts. Any other attributes are copied from the first
+# map a user or edge appears in, so this *should* be future-proof to adding
+# more attributes to SocMap.
+def mergeNetworks(filenames, outputfile):
+	index = dict()
+	nodes = [] # Attribute dictionaries, by merged node index
+	edgeIndex = dict()
+	edges = [] # (src index, dst index, attributes)
+	for filename in filenames:
+		(mapNodes, mapEdges) = readMapTables(filename)
+		for (name, attributes) in mapNodes:
+			if( not name in index ):
+				index[name] = len(nodes)
+				nodes.append(dict(attributes))
+				continue
+			node = nodes[index[name]]
+			if( attributes["mentioned"] == "true" ):
+				node["mentioned"] = "true"
+			if( attributes["retweeted"] == "true" ):
+				node["retweeted"] = "true"
+			node["layer"] = min(node["layer"], attributes["layer"])
+			node["tweets"] = max(node["tweets"], attributes["tweets"])
+		for (src, dst, attributes) in mapEdges:
+			key = (index[src], index[dst])
+			if( not key in edgeIndex ):
+				edgeIndex[key] = len(edges)
+				edges.append((key[0], key[1], dict(attributes)))
+				continue
+			edge = edges[edgeIndex[key]][2]
+			edge["retweets"] = max(edge["retweets"], attributes["retweets"])
+			edge["mentions"] = max(edge["mentions"], attributes["mentions"])
 
-	# Now that the networks are loaded, we'll add net2 onto net1
-	# Start with a list of usernames
+	# Build the merged network in one go, and save it
+	names = [None] * len(index)
+	for name in index:
+		names[index[name]] = name
 	if( has_igraph ):
-		net1names = set(net1.vs.select()["name"])
-		net2names = set(net2.vs.select()["name"])
+		net = ig.Graph(n=len(nodes), edges=[(e[0], e[1]) for e in edges], directed=True)
+		nodeAttributes = set()
+		for node in nodes:
+			nodeAttributes.update(node.keys())
+		for a in nodeAttributes:
+			net.vs[a] = [node.get(a) for node in nodes]
+		edgeAttributes = set()
+		for e in edges:
+			edgeAttributes.update(e[2].keys())
+		for a in edgeAttributes:
+			net.es[a] = [e[2].get(a) for e in edges]
 	else:
-		net1names = set(net1.nodes())
-		net2names = set(net2.nodes())
+		net = nx.DiGraph()
+		net.add_nodes_from([(names[i], nodes[i]) for i in range(0, len(nodes))])
+		net.add_edges_from([(names[e[0]], names[e[1]], e[2]) for e in edges])
+	writeNetwork(net, outputfile, cytoscape=True)
 
-	# First, find all the nodes we have to add
-	# If a node exists in both graphs, merge the attributes
-	toadd = set()
-	for name in net2names:
-		if( not name in net1names ):
-			toadd.add(name)
-		else:
-			# Merge attributes
-			if( has_igraph ):
-				net1node = net1.vs.select(name=name)[0]
-				net2node = net2.vs.select(name=name)[0]
-				if( net2node["mentioned"] == "true" ):
-					net1node["mentioned"] = "true"
-				if( net2node["retweeted"] == "true" ):
-					net1node["retweeted"] = "true"
-				net1node["layer"] = min(net1node["layer"], net2node["layer"])
-				net1node["tweets"] = max(net1node["tweets"], net2node["tweets"])
-			else:
-				if( net2.node[name]["mentioned"] == "true" ):
-					net1.node[name]["mentioned"] = "true"
-				if( net2.node[name]["retweeted"] == "true" ):
-					net1.node[name]["retweeted"] = "true"
-				net1.node[name]["layer"] = min(net1.node[name]["layer"], net2.node[name]["layer"])
-				net1.node[name]["tweets"] = max(net1.node[name]["tweets"], net2.node[name]["tweets"])
-
-	# Add all the new nodes with attributes from network2
-	# Note: Loads attributes dynamically, so *should* be future-proof to adding
-	# more attributes to SocMap
-	for name in toadd:
-		if( has_igraph ):
-			attributes = net2.vs.select(name=name)[0].attributes()
-			net1.add_vertex(**attributes)
-		else:
-			net1.add_node(name, **net2.node[name])
+def combineNetworks(file1, file2, outputfile):
+	mergeNetworks([file1, file2], outputfile)
 
-	# Now add all the new edges, copying edge attributes
+# Finds everything reachable from any of the seeds with a single breadth-first
+# search, tracking visited nodes in a bitmap, rather than traversing the same
+# region once per seed. Seeds are vertex indices for igraph and node names for
+# NetworkX. Returns a bitmap of reachable nodes, by vertex index for igraph
+# and by position in net.nodes() for NetworkX.
+# Each node's successors are looked up as we reach it, rather than copying
+# the whole graph's adjacency lists first, so pruning with low memory usage
+# really does use little memory.
+def reachableFrom(net, seeds):
 	if( has_igraph ):
-		for name in net2names:
-			net2node = net2.vs.select(name=name)[0]
-			edges = net2.incident(net2node)
-			for edge in edges:
-				e = net2.es[edge]
-				atts = e.attributes()
-				dstName = net2.vs[e.target]["name"]
-				srcID = net1.vs.select(name=name)[0].index
-				dstID = net1.vs.select(name=dstName)[0].index
-				# If edge does not exist, add it with same attributes
-				edgeID = net1.get_eid(srcID, dstID, directed=True, error=False)
-				if( edgeID == -1 ):
-					net1.add_edge(srcID, dstID, **atts)
-				else:
-					net1.es[edgeID]["retweets"] = max(net1.es[edgeID]["retweets"], e["retweets"])
-					net1.es[edgeID]["mentions"] = max(net1.es[edgeID]["mentions"], e["mentions"])
+		successors = lambda i: net.neighbors(i, mode="out")
+		frontier = list(seeds)
+		visited = bytearray(net.vcount())
 	else:
-		# NetworkX doesn't provide a clear way to get the edge attributes of
-		# all edges between two nodes (net.edges(src) discards the attributes!)
-		# So we'll iterate over edges instead of over nodes
-		edges = net2.edges.data()
-		for (src,dst,attributes) in edges:
-			if( not net1.has_edge(src, dst) ):
-				net1.add_edge(src, dst, **attributes)
-			else:
-				net1[src][dst]["retweets"] = max(net1[src][dst]["retweets"],net2[src][dst]["retweets"])
-				net1[src][dst]["mentions"] = max(net1[src][dst]["mentions"],net2[src][dst]["mentions"])
+		nodes = list(net.nodes())
+		index = dict([(n, i) for (i, n) in enumerate(nodes)])
+		successors = lambda i: [index[dst] for dst in net.successors(nodes[i])]
+		frontier = [index[seed] for seed in seeds]
+		visited = bytearray(len(nodes))
+	for i in frontier:
+		visited[i] = 1
+	while( len(frontier) > 0 ):
+		nextFrontier = []
+		for i in frontier:
+			for j in successors(i):
+				if( not visited[j] ):
+					visited[j] = 1
+					nextFrontier.append(j)
+		frontier = nextFrontier
+	return visited
 
-	# Finally, save the resulting network
+# Returns the part of a network reachable from the seeds (see reachableFrom).
+# You can force low memory usage, which deletes unreachable nodes in place
+# instead of copying the reachable ones into a new network.
+def pruneUnreachable(net, seeds, forceLowMemoryUsage=False):
+	visited = reachableFrom(net, seeds)
 	if( has_igraph ):
-		net1.write_gml(outputfile)
-	else:
-		nx.write_gml(net1, outputfile)
-		copyfile(outputfile, outputfileCytoscape)
-		patchGML(outputfileCytoscape)
+		if( forceLowMemoryUsage ):
+			net.delete_vertices([i for i in range(0, len(visited)) if not visited[i]])
+			return net
+		# Lots of memory? Great, copy just the part of the graph we need
+		# one O(n) pass, in C
+		return net.subgraph([i for i in range(0, len(visited)) if visited[i]])
+	nodes = list(net.nodes())
+	if( forceLowMemoryUsage ):
+		net.remove_nodes_from([nodes[i] for i in range(0, len(visited)) if not visited[i]])
+		return net
+	return net.subgraph([nodes[i] for i in range(0, len(visited)) if visited[i]])
 
-# Takes a GML filename for input, a Python list of usernames, and an output
+# Takes a map filename for input, a Python list of usernames, and an output
 # filename. All users from pruneUsernames are removed from the graph. Anything
 # not reachable from layer 0 is then pruned from the graph. Resulting network
 # is saved to outputfile. You can force low memory usage, which may be slow.
 def pruneNetwork(infile, pruneUsernames, outputfile, forceLowMemoryUsage=False):
-	if( has_igraph ):
-		net1 = igraphReadGML(infile)
-	else:
-		net1 = nx.read_gml(infile)
-		outputfileCytoscape = outputfile + "_cytoscape.gml"
+	net1 = readNetwork(infile)
 
 	# Delete all nodes with given usernames
 	if( has_igraph ):
@@ -312,48 +447,10 @@ def pruneNetwork(infile, pruneUsernames, outputfile, forceLowMemoryUsage=False):
 		# Consider if speed on large graphs is a serious issue.
 		seeds = [n for n,a in net1.nodes(data=True) if a["layer"] == 0]
 
-	# Now find everything reachable from the seed nodes
-	reachable = set()
+	# Now keep only what's reachable from the seed nodes
 	if( has_igraph ):
-		for seed in seeds:
-			s = seed.index # subcomponents wants index form, not object
-			from_s = net1.subcomponent(s, mode=ig.OUT) # Returns list of indices
-			reachable.add(s)
-			reachable.update(from_s)
-	else:
-		for seed in seeds:
-			reachable.add(seed)
-			reachable.update(nx.descendants(net1, seed))
-
-	# Next, delete all nodes not reachable
-	if( has_igraph ):
-		if( forceLowMemoryUsage ):
-			# Delete nodes in place, involves multiple O(n) passes and going
-			# between C and Python a few times
-			reachable_nodes = [net1.vs[i]["name"] for i in reachable]
-			toPrune = net1.vs.select(name_notin=reachable_nodes)
-			net1.delete_vertices(toPrune)
-		else:
-			# Lots of memory? Great, copy just the part of the graph we need
-			# one O(n) pass, in C
-			net2 = net1.subgraph(reachable)
-	else:
-		if( forceLowMemoryUsage ):
-			toPrune = [n for n in net1.nodes() if n not in reachable]
-			net1.remove_nodes_from(toPrune)
-		else:
-			net2 = net1.subgraph(reachable)
+		seeds = [seed.index for seed in seeds] # Index form, not objects
+	net2 = pruneUnreachable(net1, seeds, forceLowMemoryUsage)
 
 	# Finally, save results
-	if( has_igraph ):
-		if( forceLowMemoryUsage ):
-			net1.write_gml(outputfile)
-		else:
-			net2.write_gml(outputfile)
-	else:
-		if( forceLowMemoryUsage ):
-			nx.write_gml(net1, outputfile)
-		else:
-			nx.write_gml(net2, outputfile)
-		copyfile(outputfile, outputfileCytoscape)
-		patchGML(outputfileCytoscape)
+	writeNetwork(net2, outputfile, cytoscape=True)
@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+
+import sys, os, time, json, shutil, tempfile, threading, subprocess, types
+from argparse import ArgumentParser
+
+folder = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(folder + "/..") # Allow us to import files from one level up
+
+import acquire, analyze, log
+import synthetic
+
+# Benchmarks for the crawler, the map code, and the tools
+#
+# For each scale (number of users in a synthetic community, see synthetic)
+# we write a tweetdir and a cassette of the same tweets, then time each case
+# in a process of its own so we can report its peak memory use along with its
+# throughput. Crawls that download tweets go through the mock timeline API
+# (see mockapi) and the real key pool, so rate limit pacing and latency are
+# part of the measurement. Replaying the cassette (see cassette) times the
+# same crawl without the network.
+#
+# Results can be saved with --output, and compared against an earlier run
+# with --baseline to catch regressions:
+#
+#   ./bench.py --scales 1000,10000 --output before.json
+#   ...make changes...
+#   ./bench.py --scales 1000,10000 --baseline before.json
+
+TOOLS = folder + "/../tools"
+
+# Files every case can rely on, relative to a scale's workspace
+def paths(workspace):
+	return types.SimpleNamespace(
+		tweetdir=workspace + "/tweets",
+		cassette=workspace + "/cassette",
+		seeds=workspace + "/seeds.txt",
+		otherSeeds=workspace + "/seeds2.txt",
+		blocklist=workspace + "/blocklist.txt",
+		map=workspace + "/cached/map/layer%d.gml",
+		otherMap=workspace + "/other/map/layer%d.gml",
+		out=workspace + "/out")
+
+def crawlOptions(settings, workspace, tweetdir):
+	for d in ["map", "work"]:
+		os.makedirs(workspace + "/" + d, exist_ok=True)
+	return types.SimpleNamespace(
+		workdir=workspace + "/work", tweetdir=tweetdir, mapdir=workspace + "/map",
+		compress=False, binary=True, numtweets=settings["numtweets"],
+		maxreferences=float('inf'), ignoreretweets=False, ignorementions=False,
+		workers=settings["workers"], layers=settings["layers"], refresh=False, resume=False, spill=False,
+		priority=False, stream=False, budgetcalls=None, budgetseconds=None)
+
+def readSeeds(filename):
+	with open(filename, "r") as f:
+		return [line.strip() for line in f if len(line.strip()) > 0]
+
+# Crawls through the mock API into an empty tweetdir
+def benchDownload(settings, workspace, name="download", stream=False):
+	from keypool import KeyPool
+	from mockapi import MockAPI
+	p = paths(workspace)
+	population = synthetic.Population(settings["scale"], settings["tweetsPerUser"])
+	apis = [MockAPI(population, settings["latency"], settings["limit"], settings["window"]) for i in range(0, settings["keys"])]
+	options = crawlOptions(settings, workspace + "/" + name, workspace + "/" + name + "/tweets")
+	options.stream = stream
+	os.makedirs(options.tweetdir, exist_ok=True)
+	start = time.time()
+	visited = acquire.getLayers(KeyPool(apis), options.layers, options, readSeeds(p.seeds))
+	seconds = time.time() - start
+	requests = sum([api.rateLimit.requests for api in apis])
+	refused = sum([api.rateLimit.refused for api in apis])
+	return {"seconds": seconds, "items": visited, "unit": "users",
+	        "requests": requests, "refused": refused}
+
+# The same, starting each user's download as soon as they're found
+def benchStream(settings, workspace):
+	return benchDownload(settings, workspace, "stream", True)
+
+# Crawls into an empty tweetdir from a recording, which is the whole crawl
+# loop without any waiting on the network
+def benchReplay(settings, workspace):
+	from keypool import KeyPool
+	import cassette
+	p = paths(workspace)
+	options = crawlOptions(settings, workspace + "/replay", workspace + "/replay/tweets")
+	os.makedirs(options.tweetdir, exist_ok=True)
+	start = time.time()
+	visited = acquire.getLayers(KeyPool([cassette.ReplayAPI(p.cassette)]), options.layers, options, readSeeds(p.seeds))
+	return {"seconds": time.time() - start, "items": visited, "unit": "users"}
+
+# Crawls a tweetdir we already have, which is all map building
+def crawlCached(settings, workspace, name, seeds):
+	p = paths(workspace)
+	options = crawlOptions(settings, workspace + "/" + name, p.tweetdir)
+	start = time.time()
+	visited = acquire.getLayers(None, options.layers, options, readSeeds(seeds))
+	return {"seconds": time.time() - start, "items": visited, "unit": "users"}
+
+def benchCached(settings, workspace):
+	return crawlCached(settings, workspace, "cached", paths(workspace).seeds)
+
+def prepareOtherMap(settings, workspace):
+	return crawlCached(settings, workspace, "other", paths(workspace).otherSeeds)
+
+# Rebuilds the cached crawl's maps layer by layer from its user lists, the
+# way the offline tools do
+def benchSaveNetwork(settings, workspace):
+	p = paths(workspace)
+	workdir = workspace + "/cached/work"
+	mapdir = workspace + "/save"
+	os.makedirs(mapdir, exist_ok=True)
+	layers = []
+	userlist = readSeeds(p.seeds)
+	seen = set()
+	for layer in range(0, settings["layers"]):
+		retweeted = acquire.loadUserList(workdir, "layer" + str(layer) + "retweetedUsers")
+		mentioned = acquire.loadUserList(workdir, "layer" + str(layer) + "mentionedUsers")
+		tweetCounts = dict()
+		for username in userlist:
+			if( not username in seen ):
+				seen.add(username)
+				tweetCounts[username] = acquire.loadUserSummary(username, p.tweetdir)["tweets"]
+		layers.append((tweetCounts, retweeted, mentioned))
+		userlist = list(acquire.flattenUserDictionary(retweeted).union(acquire.flattenUserDictionary(mentioned)))
+	start = time.time()
+	for layer in range(0, len(layers)):
+		(tweetCounts, retweeted, mentioned) = layers[layer]
+		analyze.saveNetwork(mapdir, layer, tweetCounts, retweeted, mentioned)
+	return {"seconds": time.time() - start, "items": len(seen), "unit": "users"}
+
+def benchCombine(settings, workspace):
+	p = paths(workspace)
+	layer = settings["layers"] - 1
+	start = time.time()
+	analyze.combineNetworks(p.map % layer, p.otherMap % layer, p.out + "/combined.gml")
+	return {"seconds": time.time() - start, "items": mapSize(p.out + "/combined.gml"), "unit": "users"}
+
+def benchPrune(settings, workspace):
+	p = paths(workspace)
+	layer = settings["layers"] - 1
+	start = time.time()
+	analyze.pruneNetwork(p.map % layer, readSeeds(p.blocklist), p.out + "/pruned.gml")
+	return {"seconds": time.time() - start, "items": mapSize(p.map % layer), "unit": "users"}
+
+# Counts the users in a map without loading it into a graph library
+def mapSize(filename):
+	count = 0
+	with open(filename, "r") as f:
+		for line in f:
+			# NetworkX opens nodes with "node [", igraph puts the bracket
+			# on the next line
+			if( line.split()[:1] == ["node"] ):
+				count += 1
+	return count
+
+# Cases that run inside this script, as (name, function, reported)
+# Unreported cases just set up files that later cases need. The maps from
+# both cached crawls are used by the cases and tools after them, so those
+# crawls always run.
+CASES = [
+	("getLayers (download)", benchDownload, True),
+	("getLayers (stream)", benchStream, True),
+	("getLayers (replay)", benchReplay, True),
+	("getLayers (cached)", benchCached, True),
+	("second map", prepareOtherMap, False),
+	("saveNetwork", benchSaveNetwork, True),
+	("combineNetworks", benchCombine, True),
+	("pruneNetwork", benchPrune, True),
+]
+
+# Tools, as (script, arguments). Arguments are formatted with the paths
+# above, plus `layers` and `last`, the final layer's map.
+TOOL_CASES = [
+	("buildMentionMap.py", ["{seeds}", "{tweetdir}", "{layers}", "{out}/mentions.gml"]),
+	("buildRTMap.py", ["{seeds}", "{tweetdir}", "{layers}", "{out}/retweets.gml"]),
+	("buildMaps.py", ["{seeds}", "{tweetdir}", "{layers}", "{out}/mentions.gml", "{out}/retweets.gml", "{out}/combined.gml"]),
+	("getInsularity.py", ["{seeds}", "{tweetdir}"]),
+	("indexTweets.py", ["{tweetdir}"]),
+	("searchTweets.py", ["synthetic tweet 1[0-9]+0$", "{tweetdir}"]),
+	("archiveTweets.py", ["{tweetdir}", "{out}/archive.sqlite"]),
+	("convertMap.py", ["{last}", "{out}/map.smap"]),
+	("patchGML.py", ["{last}", "{out}/patched.gml"]),
+	("getDegreePercentile.py", ["90", "{last}"]),
+	("getDensity.py", ["{last}"]),
+	("listDegrees.py", ["{last}"]),
+	("sortNodeDegrees.py", ["{last}"]),
+	("mergeMaps.py", ["{last}", "{otherLast}", "{out}/merged.gml"]),
+	("pruneInaccessible.py", ["{last}", "{out}/accessible.gml"]),
+	("pruneMentions.py", ["2", "{last}", "{out}/mentions2.gml"]),
+	("pruneRetweets.py", ["2", "{last}", "{out}/retweets2.gml"]),
+	("pruneTweets.py", ["10", "{last}", "{out}/tweets10.gml"]),
+	("pruneUsers.py", ["{last}", "{blocklist}", "{out}/users.gml"]),
+	("removeLowDegreeNodes.py", ["2", "{last}", "{out}/degree2.gml"]),
+	("separateRTs.py", ["{last}", "{out}/separated.gml"]),
+	("splitRetweetsAndMentions.py", ["{last}", "{out}/split_rt.gml", "{out}/split_mentions.gml"]),
+	("pruneMap.py", ["{last}", "{out}/pipeline.gml", "--min-mentions", "2", "--min-tweets", "10", "--reachable", "--giant"]),
+]
+
+# Peak memory of this process in bytes. Linux resets the high water mark
+# when a process starts a new program, so we don't count the memory of the
+# benchmark process that started us.
+def peakMemory():
+	try:
+		with open("/proc/self/status", "r") as f:
+			for line in f:
+				if( line.startswith("VmHWM:") ):
+					return int(line.split()[1]) * 1024
+	except OSError:
+		pass
+	import resource
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	# Linux reports kilobytes, macOS bytes
+	return peak if sys.platform == "darwin" else peak * 1024
+
+# Runs a benchmark in a process of its own (see runCase and runTool).
+# Returns its exit status, its stats, and what it printed. Output goes to
+# temporary files, so a chatty tool can't fill a pipe and stall.
+def measure(command):
+	with tempfile.TemporaryFile() as stdout, tempfile.TemporaryFile() as stderr, tempfile.NamedTemporaryFile() as stats:
+		command = [sys.executable, os.path.realpath(__file__)] + command[:1] + [stats.name] + command[1:]
+		returncode = subprocess.call(command, stdout=stdout, stderr=stderr)
+		stdout.seek(0)
+		stderr.seek(0)
+		output = stdout.read().decode("utf-8", "replace")
+		errors = stderr.read().decode("utf-8", "replace")
+		result = stats.read().decode("utf-8")
+	result = json.loads(result) if len(result) > 0 else dict()
+	return (returncode, result, output, errors)
+
+def runCase(statsFilename, name, workspace):
+	with open(workspace + "/settings.json", "r") as f:
+		settings = json.load(f)
+	logger = threading.Thread(target=log.logHandler, args=(workspace, "benchmark.log", False))
+	logger.daemon = True
+	logger.start()
+	for (caseName, function, reported) in CASES:
+		if( caseName == name ):
+			result = function(settings, workspace)
+			result["peak"] = peakMemory()
+			log.shutdown()
+			with open(statsFilename, "w") as f:
+				json.dump(result, f)
+			return
+	raise ValueError("Unknown benchmark case '%s'" % name)
+
+# Runs a tool as if from the command line, timing it from start to finish
+def runTool(statsFilename, script, arguments):
+	import runpy
+	sys.argv = [script] + arguments
+	start = time.time()
+	status = 0
+	try:
+		runpy.run_path(script, run_name="__main__")
+	except SystemExit as e:
+		status = e.code
+	result = {"seconds": time.time() - start, "peak": peakMemory()}
+	with open(statsFilename, "w") as f:
+		json.dump(result, f)
+	sys.exit(status)
+
+# Writes the synthetic tweetdir and the files the cases share
+def prepare(settings, workspace):
+	p = paths(workspace)
+	population = synthetic.Population(settings["scale"], settings["tweetsPerUser"])
+	synthetic.writeCorpus(population, p.tweetdir)
+	synthetic.writeCassette(population, p.cassette, settings["numtweets"])
+	with open(p.seeds, "w") as f:
+		f.write("\n".join(population.seeds(settings["seeds"])) + "\n")
+	with open(p.otherSeeds, "w") as f:
+		f.write("\n".join(population.seeds(settings["seeds"], seed=1)) + "\n")
+	# Pruning the most popular accounts is a common cleanup step
+	with open(p.blocklist, "w") as f:
+		f.write("\n".join(population.users[:max(1, settings["scale"] // 100)]) + "\n")
+	os.makedirs(p.out, exist_ok=True)
+	with open(workspace + "/settings.json", "w") as f:
+		json.dump(settings, f)
+
+def runScale(settings, workspace, only):
+	results = []
+	def report(name, returncode, stats, stderr):
+		if( returncode != 0 ):
+			print("%-28s FAILED (exit status %d)" % (name, returncode))
+			print(stderr.rstrip())
+			results.append({"scale": settings["scale"], "case": name, "failed": True})
+			return
+		result = {"scale": settings["scale"], "case": name}
+		result.update(stats)
+		if( "items" in result ):
+			result["throughput"] = result["items"] / max(result["seconds"], 1e-9)
+			rate = "%10.1f %s/s" % (result["throughput"], result["unit"])
+		else:
+			rate = ""
+		print("%-28s %9.2fs %9.1fMB %s" % (name, result["seconds"], result["peak"] / 1048576.0, rate))
+		results.append(result)
+
+	print("Generating %d users..." % settings["scale"])
+	start = time.time()
+	prepare(settings, workspace)
+	print("%-28s %9.2fs" % ("(synthetic corpus)", time.time() - start))
+	for (name, function, reported) in CASES:
+		needed = function in (benchCached, prepareOtherMap)
+		if( only != None and not name in only ):
+			if( not needed ):
+				continue
+			reported = False
+		(returncode, stats, output, stderr) = measure(["--run-case", name, workspace])
+		if( not reported ):
+			if( returncode != 0 ):
+				raise RuntimeError("Benchmark setup '%s' failed:\n%s" % (name, stderr))
+			continue
+		report(name, returncode, stats, stderr)
+
+	p = paths(workspace)
+	last = settings["layers"] - 1
+	values = {"seeds": p.seeds, "tweetdir": p.tweetdir, "blocklist": p.blocklist,
+	          "out": p.out, "layers": settings["layers"], "last": p.map % last,
+	          "otherLast": p.otherMap % last}
+	users = mapSize(p.map % last)
+	for (script, arguments) in TOOL_CASES:
+		if( only != None and not script in only ):
+			continue
+		command = ["--run-tool", TOOLS + "/" + script] + [a.format(**values) for a in arguments]
+		(returncode, stats, output, stderr) = measure(command)
+		stats.update({"items": users, "unit": "users"})
+		report(script, returncode, stats, stderr)
+	return results
+
+# Differences smaller than this are noise, as (seconds, bytes)
+NOISE = {"seconds": 0.1, "peak": 4 * 1048576}
+
+# Lists cases that got slower or bigger than the baseline by more than the
+# tolerance
+def compare(results, baselineFilename, tolerance):
+	with open(baselineFilename, "r") as f:
+		baseline = dict([((r["scale"], r["case"]), r) for r in json.load(f) if not r.get("failed")])
+	regressions = []
+	for result in results:
+		old = baseline.get((result["scale"], result["case"]))
+		if( old == None or result.get("failed") ):
+			continue
+		for (field, unit) in [("seconds", "s"), ("peak", "B")]:
+			if( result[field] > old[field] * (1 + tolerance) and result[field] - old[field] > NOISE[field] ):
+				regressions.append("%s at %d users: %s went from %.2f%s to %.2f%s" % (result["case"], result["scale"], field, old[field], unit, result[field], unit))
+	return regressions
+
+def parseOptions():
+	parser = ArgumentParser(description="Benchmark SocMap on synthetic data")
+	parser.add_argument("--scales", default="1000,5000", type=str, dest="scales",
+	                    help="Comma separated community sizes to benchmark")
+	parser.add_argument("--only", default=None, type=str, dest="only",
+	                    help="Comma separated cases or tools to run (default all)")
+	parser.add_argument("--tweets", default=50, type=int, dest="tweetsPerUser",
+	                    help="Average tweets per synthetic user")
+	parser.add_argument("--seeds", default=5, type=int, dest="seeds",
+	                    help="How many seed users to crawl from")
+	parser.add_argument("--layers", default=3, type=int, dest="layers",
+	                    help="How many layers to crawl")
+	parser.add_argument("--numtweets", default=200, type=int, dest="numtweets",
+	                    help="Tweets requested per page from the mock API")
+	parser.add_argument("--workers", default=8, type=int, dest="workers",
+	                    help="Download threads for crawls through the mock API")
+	parser.add_argument("--keys", default=2, type=int, dest="keys",
+	                    help="How many mock API keys to use")
+	parser.add_argument("--latency", default=0.05, type=float, dest="latency",
+	                    help="Average mock API response time in seconds")
+	parser.add_argument("--limit", default=900, type=int, dest="limit",
+	                    help="Mock API requests per key per rate limit window")
+	parser.add_argument("--window", default=15, type=int, dest="window",
+	                    help="Mock API rate limit window in seconds (Twitter's is 900)")
+	parser.add_argument("--workspace", default=None, type=str, dest="workspace",
+	                    help="Where to keep generated data (default: a temporary directory)")
+	parser.add_argument("--output", default=None, type=str, dest="output",
+	                    help="Save results as JSON")
+	parser.add_argument("--baseline", default=None, type=str, dest="baseline",
+	                    help="Compare against results saved with --output")
+	parser.add_argument("--tolerance", default=0.2, type=float, dest="tolerance",
+	                    help="How much slower or larger a case may get before it's a regression")
+	return parser.parse_args()
+
+if __name__ == "__main__":
+	# Each case runs in a new process started by measure()
+	if( len(sys.argv) > 1 and sys.argv[1] == "--run-case" ):
+		runCase(sys.argv[2], sys.argv[3], sys.argv[4])
+		sys.exit(0)
+	if( len(sys.argv) > 1 and sys.argv[1] == "--run-tool" ):
+		runTool(sys.argv[2], sys.argv[3], sys.argv[4:])
+	options = parseOptions()
+
+	tmp = None
+	workspace = options.workspace
+	if( workspace == None ):
+		tmp = tempfile.TemporaryDirectory()
+		workspace = tmp.name
+	only = None
+	if( options.only != None ):
+		only = set(options.only.split(","))
+
+	results = []
+	for scale in [int(s) for s in options.scales.split(",")]:
+		settings = dict(vars(options))
+		settings["scale"] = scale
+		scaleWorkspace = workspace + "/scale" + str(scale)
+		if( os.path.isdir(scaleWorkspace) ):
+			shutil.rmtree(scaleWorkspace)
+		os.makedirs(scaleWorkspace)
+		results.extend(runScale(settings, scaleWorkspace, only))
+
+	if( options.output != None ):
+		with open(options.output, "w") as f:
+			json.dump(results, f, indent=1)
+	if( options.baseline != None ):
+		regressions = compare(results, options.baseline, options.tolerance)
+		for regression in regressions:
+			print("REGRESSION: " + regression)
+		if( len(regressions) > 0 ):
+			sys.exit(1)
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+import sys, os, json, time, random, threading, types
+import tweepy
+from synthetic import toStatus
+
+folder = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(folder + "/..") # Allow us to import files from one level up
+
+import cassette
+
+# A local stand-in for tweepy's user_timeline endpoint
+#
+# Serves timelines from a synthetic population (see synthetic) with simulated
+# network latency, and keeps a rate limit budget per API key that's reported
+# through the same x-rate-limit-* headers Twitter sends, so the key pool's
+# governors pace it exactly as they would the real thing. Going over budget
+# gets a 429, and private or unknown users get a 401 or 404.
+#
+# Twitter's windows are 15 minutes long, which is too slow to benchmark
+# against, so the window can be shortened.
+
+# The rate limit budget of one API key. Shared between the copies of an API
+# the key pool makes for each thread.
+class RateLimit(object):
+	def __init__(self, limit, window):
+		self.limit = limit
+		self.window = window
+		self.remaining = limit
+		self.reset = time.time() + window
+		self.requests = 0
+		self.refused = 0
+		self.lock = threading.Lock()
+
+	# Spends a request from the budget, returning False if there's none left
+	def take(self, now):
+		with self.lock:
+			if( now >= self.reset ):
+				self.remaining = self.limit
+				self.reset = now + self.window
+			self.requests += 1
+			if( self.remaining <= 0 ):
+				self.refused += 1
+				return False
+			self.remaining -= 1
+			return True
+
+	def headers(self):
+		with self.lock:
+			return {"x-rate-limit-limit": str(self.limit),
+			        "x-rate-limit-remaining": str(self.remaining),
+			        "x-rate-limit-reset": str(int(self.reset))}
+
+class Response(object):
+	def __init__(self, status_code, headers, text):
+		self.status_code = status_code
+		self.headers = headers
+		self.text = text
+
+class MockAPI(object):
+	def __init__(self, population, latency=0.05, limit=900, window=15*60):
+		self.population = population
+		self.latency = latency
+		self.rateLimit = RateLimit(limit, window)
+		self.last_response = None
+		self.parser = tweepy.parsers.ModelParser()
+
+	# Response times are roughly log-normal, scaled so they average out to
+	# the given latency (this distribution's mean is e^0.125)
+	def wait(self):
+		if( self.latency > 0 ):
+			time.sleep(self.latency * random.lognormvariate(0, 0.5) / 1.1331)
+
+	def error(self, status, message):
+		self.last_response = Response(status, self.rateLimit.headers(), json.dumps({"errors": [{"message": message}]}))
+		raise tweepy.error.TweepError(message, self.last_response)
+
+	def user_timeline(self, *args, **kwargs):
+		# tweepy's cursors ask for a description of the method, which tells
+		# them how to parse the response
+		if( kwargs.get("create") ):
+			return types.SimpleNamespace(api=self, payload_type="status", payload_list=True)
+		self.wait()
+		if( not self.rateLimit.take(time.time()) ):
+			self.error(429, "Rate limit exceeded")
+		username = kwargs["screen_name"].lower()
+		if( not self.population.exists(username) ):
+			self.error(404, "Sorry, that page does not exist.")
+		if( username in self.population.private ):
+			self.error(401, "Not authorized.")
+		timeline = self.population.timeline(username)
+		page = cassette.timelinePage(timeline, kwargs, lambda tweet: tweet.id)
+		text = json.dumps([toStatus(t) for t in page])
+		self.last_response = Response(200, self.rateLimit.headers(), text)
+		return text
+
+# tweepy's cursors page through timelines by tweet ID
+MockAPI.user_timeline.pagination_mode = "id"
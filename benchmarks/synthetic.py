@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+import sys, os, random, datetime, itertools, functools, json
+
+folder = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(folder + "/..") # Allow us to import files from one level up
+
+import acquire, tweetarchive, cassette
+
+# Synthetic Twitter communities for benchmarking
+#
+# In real communities a handful of accounts get most of the mentions and
+# retweets, so who a tweet refers to is drawn from a power-law (Zipf)
+# popularity distribution over the users. Timelines are generated on demand
+# from a per-user random seed, so the same population can be served through
+# the mock timeline API (see mockapi) or written straight into a tweetdir, and
+# crawls over either produce the same maps.
+
+START = datetime.datetime(2018, 10, 10, 20, 0, 0)
+
+# Twitter's timestamp format, as found in API responses
+DATE_FORMAT = "%a %b %d %H:%M:%S +0000 %Y"
+
+class SyntheticTweet(object):
+	__slots__ = ("id", "user", "text", "timestamp", "source", "retweets")
+
+	def __init__(self, id, user, text, timestamp, source=None, retweets=0):
+		self.id = id
+		self.user = user
+		self.text = text
+		self.timestamp = timestamp
+		self.source = source
+		self.retweets = retweets
+
+class Population(object):
+	def __init__(self, numUsers, tweetsPerUser=50, alpha=1.2, retweetRatio=0.3, maxMentions=3, privateRatio=0.01, seed=0):
+		self.numUsers = numUsers
+		self.tweetsPerUser = tweetsPerUser
+		self.retweetRatio = retweetRatio
+		self.maxMentions = maxMentions
+		self.seed = seed
+		self.users = ["user" + str(i) for i in range(0, numUsers)]
+		# User i is the i'th most popular
+		weights = [1.0 / ((i + 1) ** alpha) for i in range(0, numUsers)]
+		self.cumWeights = list(itertools.accumulate(weights))
+		rng = random.Random(seed)
+		# Private and deleted accounts, which the API refuses to serve
+		self.private = set(rng.sample(self.users, int(numUsers * privateRatio)))
+		self.timeline = functools.lru_cache(maxsize=1024)(self.generateTimeline)
+
+	def index(self, username):
+		return int(username[len("user"):])
+
+	def exists(self, username):
+		return username.startswith("user") and username[len("user"):].isdigit() and self.index(username) < self.numUsers
+
+	def popular(self, rng, k):
+		return rng.choices(self.users, cum_weights=self.cumWeights, k=k)
+
+	# Picks seed users the way a researcher would: a few well known accounts
+	# from the popular end of the community
+	def seeds(self, count, seed=0):
+		rng = random.Random(seed)
+		candidates = [u for u in self.users[:max(count * 10, 100)] if not u in self.private]
+		return rng.sample(candidates, min(count, len(candidates)))
+
+	# Returns a user's tweets, newest first
+	def generateTimeline(self, username):
+		i = self.index(username)
+		rng = random.Random(self.seed * 1000003 + i)
+		numTweets = rng.randint(1, 2 * self.tweetsPerUser - 1)
+		timeline = []
+		timestamp = START
+		for j in range(numTweets, 0, -1):
+			id = (i + 1) * 1000000 + j
+			timestamp -= datetime.timedelta(minutes=rng.randint(1, 600))
+			if( rng.random() < self.retweetRatio ):
+				source = self.popular(rng, 1)[0]
+				text = "RT @" + source + ": synthetic tweet " + str(id)
+				retweets = int(rng.paretovariate(1.2))
+				timeline.append(SyntheticTweet(id, username, text, timestamp, source, retweets))
+			else:
+				mentions = self.popular(rng, rng.randint(0, self.maxMentions))
+				text = " ".join(["@" + m for m in mentions] + ["synthetic tweet", str(id)])
+				timeline.append(SyntheticTweet(id, username, text, timestamp))
+		return timeline
+
+# Renders a tweet the way the timeline endpoint returns it, with just the
+# fields tweepy and acquire look at
+def toStatus(tweet):
+	status = {
+		"id": tweet.id,
+		"id_str": str(tweet.id),
+		"created_at": tweet.timestamp.strftime(DATE_FORMAT),
+		"text": tweet.text,
+		"user": {"id": tweet.id // 1000000, "screen_name": tweet.user.capitalize()},
+		"retweet_count": tweet.retweets,
+	}
+	if( tweet.source != None ):
+		status["retweeted_status"] = {
+			"id": tweet.id + 500000,
+			"id_str": str(tweet.id + 500000),
+			"created_at": tweet.timestamp.strftime(DATE_FORMAT),
+			"text": "synthetic tweet",
+			"user": {"id": 0, "screen_name": tweet.source.capitalize()},
+			"retweet_count": tweet.retweets,
+		}
+	return status
+
+# Converts a tweet the same way acquire.getUserTweets does
+def toTweet(tweet):
+	mentions = acquire.getMentionsFromText(tweet.text)
+	if( tweet.source != None ):
+		return acquire.Retweet(tweet.user, tweet.text, tweet.timestamp, mentions, tweet.source, tweet.retweets, tweet.id)
+	return acquire.Tweet(tweet.user, tweet.text, tweet.timestamp, mentions, tweet.id)
+
+# Writes every user's tweets into a tweetdir (or archive), as if they'd been
+# crawled. Private users get an empty file, like a real crawl leaves behind.
+def writeCorpus(population, tweetdir, compression=False, binary=True):
+	if( not tweetarchive.isArchive(tweetdir) ):
+		os.makedirs(tweetdir, exist_ok=True)
+	for username in population.users:
+		tweets = []
+		if( not username in population.private ):
+			tweets = [toTweet(t) for t in population.timeline(username)]
+		acquire.saveTweetsToFile(username, tweets, tweetdir, compression, binary)
+
+# Writes every user's timeline into a cassette (see cassette), as if a crawl
+# had recorded it a page at a time
+def writeCassette(population, directory, pageSize=200):
+	recording = cassette.Cassette(directory)
+	for username in population.users:
+		if( username in population.private ):
+			recording.record(username, True, 401, "Not authorized.")
+			continue
+		timeline = [toStatus(t) for t in population.timeline(username)]
+		for i in range(0, max(1, len(timeline)), pageSize):
+			recording.record(username, i == 0, 200, json.dumps(timeline[i:i+pageSize]))
+
+if __name__ == "__main__":
+	if( len(sys.argv) < 3 ):
+		print("USAGE: %s <number of users> <tweetdir or archive> [tweets per user] [--compress] [--json]" % sys.argv[0])
+		sys.exit(1)
+	numUsers = int(sys.argv[1])
+	tweetdir = sys.argv[2]
+	tweetsPerUser = 50
+	if( len(sys.argv) > 3 and not sys.argv[3].startswith("--") ):
+		tweetsPerUser = int(sys.argv[3])
+	population = Population(numUsers, tweetsPerUser)
+	writeCorpus(population, tweetdir, "--compress" in sys.argv, not "--json" in sys.argv)
+	print("Seed users: " + " ".join(population.seeds(5)))
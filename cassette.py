@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+import os, gzip, json, types, threading
+import tweepy
+import log
+
+# Recording and replaying timeline API responses
+#
+# A cassette is a directory holding the raw responses we got from the
+# timeline endpoint, one GZIP compressed file per user. Each line of a file is
+# one response, as {"status": HTTP status, "text": response body}. A crawl
+# made with --record saves every response it gets, and a crawl made with
+# --replay answers requests from the cassette instead of Twitter, so it needs
+# no API keys and never waits on rate limits.
+#
+# Replay pages through the tweets it has recorded for a user rather than
+# repeating the exact requests, so it works with a different --numtweets, and
+# it can serve any crawl that doesn't reach users outside the recording.
+
+# Returns the page of a timeline (a list of tweets, newest first) that the
+# timeline endpoint would send for a request's count, max_id and since_id.
+# `tweetID` gets a tweet's ID. The benchmarks' mock API pages the same way.
+def timelinePage(timeline, kwargs, tweetID):
+	maxID = kwargs.get("max_id")
+	sinceID = kwargs.get("since_id")
+	page = []
+	for tweet in timeline:
+		if( len(page) >= kwargs.get("count", 20) ):
+			break
+		if( maxID != None and tweetID(tweet) > maxID ):
+			continue
+		if( sinceID != None and tweetID(tweet) <= sinceID ):
+			continue
+		page.append(tweet)
+	return page
+
+class Cassette(object):
+	def __init__(self, directory):
+		self.directory = directory
+		os.makedirs(directory, exist_ok=True)
+
+	def filename(self, username):
+		return self.directory + "/" + username + ".json.gz"
+
+	# Appends a response to a user's recording. The first page of a timeline
+	# starts the recording over. GZIP files can be appended to, and read back
+	# as if they'd been written in one go.
+	def record(self, username, firstPage, status, text):
+		mode = "wb" if firstPage else "ab"
+		with gzip.open(self.filename(username), mode) as f:
+			f.write((json.dumps({"status": status, "text": text}) + "\n").encode("utf-8"))
+
+	# Returns (status, tweets) for a user, where tweets are the decoded
+	# statuses from every page we recorded, newest first. Returns None if
+	# the user isn't in the cassette.
+	def load(self, username):
+		if( not os.path.isfile(self.filename(username)) ):
+			return None
+		status = 200
+		tweets = dict()
+		with gzip.open(self.filename(username), "rb") as f:
+			for line in f:
+				response = json.loads(line.decode("utf-8"))
+				if( response["status"] != 200 ):
+					status = response["status"]
+					continue
+				for tweet in json.loads(response["text"]):
+					tweets[tweet["id"]] = tweet
+		return (status, [tweets[i] for i in sorted(tweets.keys(), reverse=True)])
+
+# Wraps a key pool (or anything else with a `method`), saving every
+# timeline response that comes back. Rate limit errors aren't saved, since
+# the request is tried again, but private and missing users are.
+class Recorder(object):
+	def __init__(self, api, directory):
+		self.api = api
+		self.cassette = Cassette(directory)
+
+	def __len__(self):
+		return len(self.api)
+
+	def method(self, name):
+		call = self.api.method(name)
+		def record(*args, **kwargs):
+			if( kwargs.get("create") ):
+				return call(*args, **kwargs)
+			username = kwargs["screen_name"].lower()
+			# A refresh (asking for tweets since an ID) adds to the recording
+			firstPage = kwargs.get("max_id") == None and kwargs.get("since_id") == None
+			try:
+				# Cursors ask for the raw response body
+				text = call(*args, **kwargs)
+			except tweepy.error.TweepError as e:
+				if( e.response is not None and e.response.status_code in (401, 404) ):
+					self.cassette.record(username, firstPage, e.response.status_code, e.response.text)
+				raise
+			self.cassette.record(username, firstPage, 200, text)
+			return text
+		record.pagination_mode = call.pagination_mode
+		return record
+
+class Response(object):
+	def __init__(self, status_code, text):
+		self.status_code = status_code
+		self.headers = dict() # No rate limits to tell the governors about
+		self.text = text
+
+# Answers timeline requests from a cassette, in place of a tweepy API.
+# Give it to a KeyPool like any other API.
+class ReplayAPI(object):
+	def __init__(self, directory):
+		self.cassette = Cassette(directory)
+		self.parser = tweepy.parsers.ModelParser()
+		self.last_response = None
+		# Timelines are requested a page at a time, so each thread keeps the
+		# recording it's paging through
+		self.local = threading.local()
+
+	def recording(self, username):
+		if( getattr(self.local, "username", None) != username ):
+			self.local.username = username
+			self.local.recording = self.cassette.load(username)
+		return self.local.recording
+
+	def error(self, status, message):
+		self.last_response = Response(status, json.dumps({"errors": [{"message": message}]}))
+		raise tweepy.error.TweepError(message, self.last_response)
+
+	def user_timeline(self, *args, **kwargs):
+		# tweepy's cursors ask for a description of the method, which tells
+		# them how to parse the response
+		if( kwargs.get("create") ):
+			return types.SimpleNamespace(api=self, payload_type="status", payload_list=True)
+		username = kwargs["screen_name"].lower()
+		recording = self.recording(username)
+		if( recording == None ):
+			log.log(log.warn, "No recording of " + username + "'s timeline, treating them as missing")
+			self.error(404, "No recording for " + username)
+		(status, tweets) = recording
+		if( status != 200 ):
+			self.error(status, "Recorded error for " + username)
+		text = json.dumps(timelinePage(tweets, kwargs, lambda tweet: tweet["id"]))
+		self.last_response = Response(200, text)
+		return text
+
+# tweepy's cursors page through timelines by tweet ID
+ReplayAPI.user_timeline.pagination_mode = "id"
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+
+import tempfile, heapq
+from array import array
+
+# Compact bookkeeping for big crawls
+#
+# A crawl used to keep every user it had visited as a set of usernames, and
+# each layer's references as dictionaries of dictionaries of usernames. At a
+# few million users that's tens of gigabytes of Python objects before we
+# build any maps. Instead:
+#
+#   Usernames    numbers every username we come across, so everything else
+#                can refer to users with small integers
+#   UserFlags    one byte per user, for the visited and refreshed sets
+#   TweetCounts  parallel arrays of users and their tweet counts
+#   References   who referenced who, how many times, as flat arrays of user
+#                numbers and counts (four bytes each). Given a directory,
+#                they're spilled to a temporary file there every
+#                SPILL_EDGES references, so only that many are in memory.
+#   Priorities   how much each user has been referenced, for crawling the
+#                most referenced users first
+#
+# TweetCounts and References have items() like the dictionaries they
+# replace, yielding usernames, so anything that read those can read these.
+
+SPILL_EDGES = 1 << 20
+
+class Usernames(object):
+	def __init__(self):
+		self.ids = dict()
+		self.names = []
+
+	def __len__(self):
+		return len(self.names)
+
+	def id(self, username):
+		userID = self.ids.get(username)
+		if( userID == None ):
+			userID = len(self.names)
+			self.ids[username] = userID
+			self.names.append(username)
+		return userID
+
+	def name(self, userID):
+		return self.names[userID]
+
+class UserFlags(object):
+	def __init__(self):
+		self.flags = bytearray()
+		self.count = 0
+
+	def __len__(self):
+		return self.count
+
+	def __contains__(self, userID):
+		return userID < len(self.flags) and self.flags[userID] == 1
+
+	def add(self, userID):
+		if( userID >= len(self.flags) ):
+			self.flags.extend(bytes(max(userID + 1 - len(self.flags), len(self.flags))))
+		if( self.flags[userID] == 0 ):
+			self.flags[userID] = 1
+			self.count += 1
+
+class TweetCounts(object):
+	def __init__(self, names):
+		self.names = names
+		self.users = array("I")
+		self.counts = array("I")
+
+	def __len__(self):
+		return len(self.users)
+
+	def add(self, username, tweets):
+		self.users.append(self.names.id(username))
+		self.counts.append(tweets)
+
+	def items(self):
+		for i in range(0, len(self.users)):
+			yield (self.names.name(self.users[i]), self.counts[i])
+
+class References(object):
+	def __init__(self, names, spillDir=None):
+		self.names = names
+		self.spillDir = spillDir
+		self.spillFile = None
+		self.sourceCount = 0
+		self.reset()
+
+	# Starts a new chunk of references in memory. `ends` holds where each
+	# source's references end in `targets` and `counts`.
+	def reset(self):
+		self.sources = array("I")
+		self.ends = array("Q")
+		self.targets = array("I")
+		self.counts = array("I")
+
+	def __len__(self):
+		return self.sourceCount
+
+	# Adds a user's references, a dictionary of username -> count
+	def add(self, username, references):
+		if( len(references) == 0 ):
+			return
+		self.sources.append(self.names.id(username))
+		for (target, count) in references.items():
+			self.targets.append(self.names.id(target))
+			self.counts.append(count)
+		self.ends.append(len(self.targets))
+		self.sourceCount += 1
+		if( self.spillDir != None and len(self.targets) >= SPILL_EDGES ):
+			self.spill()
+
+	def spill(self):
+		if( self.spillFile == None ):
+			self.spillFile = tempfile.TemporaryFile(dir=self.spillDir)
+		f = self.spillFile
+		f.seek(0, 2)
+		array("Q", [len(self.sources), len(self.targets)]).tofile(f)
+		for column in [self.sources, self.ends, self.targets, self.counts]:
+			column.tofile(f)
+		self.reset()
+
+	# Yields (sources, ends, targets, counts) for every chunk, spilled or not
+	def chunks(self):
+		if( self.spillFile != None ):
+			f = self.spillFile
+			f.seek(0, 2)
+			size = f.tell()
+			f.seek(0)
+			while( f.tell() < size ):
+				header = array("Q")
+				header.fromfile(f, 2)
+				(numSources, numTargets) = header
+				chunk = []
+				for (code, length) in [("I", numSources), ("Q", numSources), ("I", numTargets), ("I", numTargets)]:
+					column = array(code)
+					column.fromfile(f, length)
+					chunk.append(column)
+				yield tuple(chunk)
+		yield (self.sources, self.ends, self.targets, self.counts)
+
+	# Yields (username, {username: count}) for every user with references
+	def items(self):
+		name = self.names.name
+		for (sources, ends, targets, counts) in self.chunks():
+			start = 0
+			for i in range(0, len(sources)):
+				end = ends[i]
+				yield (name(sources[i]), dict([(name(targets[j]), counts[j]) for j in range(start, end)]))
+				start = end
+
+	def close(self):
+		if( self.spillFile != None ):
+			self.spillFile.close()
+			self.spillFile = None
+		self.sourceCount = 0
+		self.reset()
+
+# Users waiting to be crawled, most referenced first. A user's weight is how
+# many times they've been mentioned or retweeted by the users crawled so far,
+# so it goes up as we crawl more of the users who reference them, whether or
+# not they're waiting yet. Ties go to whoever started waiting first.
+# The heap can hold old entries for a user whose weight has since gone up;
+# pop() skips them.
+class Priorities(object):
+	def __init__(self):
+		self.weights = array("Q")
+		self.positions = array("Q")
+		self.waiting = bytearray()
+		self.heap = []
+		self.count = 0
+		self.pushed = 0
+
+	def __len__(self):
+		return self.count
+
+	def grow(self, userID):
+		if( userID >= len(self.waiting) ):
+			extra = max(userID + 1 - len(self.waiting), len(self.waiting))
+			self.weights.frombytes(bytes(8 * extra))
+			self.positions.frombytes(bytes(8 * extra))
+			self.waiting.extend(bytes(extra))
+
+	def weight(self, userID):
+		return self.weights[userID] if userID < len(self.weights) else 0
+
+	def push(self, userID):
+		self.grow(userID)
+		if( self.waiting[userID] == 1 ):
+			return
+		self.waiting[userID] = 1
+		self.positions[userID] = self.pushed
+		self.pushed += 1
+		self.count += 1
+		heapq.heappush(self.heap, (-self.weights[userID], self.positions[userID], userID))
+
+	def add(self, userID, amount):
+		self.grow(userID)
+		self.weights[userID] += amount
+		if( self.waiting[userID] == 1 ):
+			heapq.heappush(self.heap, (-self.weights[userID], self.positions[userID], userID))
+
+	# Returns the heaviest waiting user, or None if nobody's waiting
+	def pop(self):
+		while( len(self.heap) > 0 ):
+			(weight, position, userID) = heapq.heappop(self.heap)
+			if( self.waiting[userID] == 1 and -weight == self.weights[userID] ):
+				self.waiting[userID] = 0
+				self.count -= 1
+				return userID
+		return None
+
+# Returns every user referenced in any of the given References, in the order
+# they're first referenced, as an array of user numbers
+def frontier(names, *references):
+	seen = bytearray(len(names))
+	users = array("I")
+	for refs in references:
+		for (sources, ends, targets, counts) in refs.chunks():
+			for target in targets:
+				if( seen[target] == 0 ):
+					seen[target] = 1
+					users.append(target)
+	return users
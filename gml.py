@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+import math
+
+# Streaming GML output for NetworkX graphs
+#
+# NetworkX writes a "label" line for every node, which stops Cytoscape from
+# opening the file. We used to write the GML, copy it, then read the whole
+# copy back in to strip the labels with a regex. Instead, this writes the
+# standard and Cytoscape-compatible files side by side in a single pass over
+# the graph, one line at a time, using the same layout as nx.write_gml.
+
+# Matches NetworkX's escaping of quotes, ampersands, and non-ASCII text
+def escape(text):
+	res = []
+	for c in text:
+		if( c == '"' or c == "&" or ord(c) < 0x20 or ord(c) > 0x7e ):
+			res.append("&#" + str(ord(c)) + ";")
+		else:
+			res.append(c)
+	return "".join(res)
+
+def formatValue(value):
+	if( isinstance(value, bool) ):
+		return str(int(value))
+	if( isinstance(value, int) ):
+		return str(value)
+	if( isinstance(value, float) ):
+		if( math.isnan(value) ):
+			return "NAN"
+		if( math.isinf(value) ):
+			return "+INF" if value > 0 else "-INF"
+		text = repr(value).upper()
+		if( not "." in text ):
+			# GML needs a decimal point to tell floats from integers
+			if( "E" in text ):
+				text = text.replace("E", ".E", 1)
+			else:
+				text += ".0"
+		return text
+	return '"' + escape(str(value)) + '"'
+
+# Yields the lines of a GML file, along with whether to keep each line in the
+# Cytoscape version
+def gmlLines(net):
+	yield ("graph [", True)
+	if( net.is_directed() ):
+		yield ("  directed 1", True)
+	for (key, value) in net.graph.items():
+		if( not key in ("directed", "multigraph", "node", "edge") ):
+			yield ("  " + key + " " + formatValue(value), True)
+	ids = dict()
+	for (node, attributes) in net.nodes(data=True):
+		ids[node] = len(ids)
+		yield ("  node [", True)
+		yield ("    id " + str(ids[node]), True)
+		yield ("    label " + formatValue(str(node)), False)
+		for (key, value) in attributes.items():
+			if( not key in ("id", "label") ):
+				yield ("    " + key + " " + formatValue(value), True)
+		yield ("  ]", True)
+	for (src, dst, attributes) in net.edges(data=True):
+		yield ("  edge [", True)
+		yield ("    source " + str(ids[src]), True)
+		yield ("    target " + str(ids[dst]), True)
+		for (key, value) in attributes.items():
+			if( not key in ("source", "target") ):
+				yield ("    " + key + " " + formatValue(value), True)
+		yield ("  ]", True)
+	yield ("]", True)
+
+# Writes a NetworkX graph as GML, and optionally the Cytoscape-compatible
+# version of the same file at the same time
+def writeGML(net, filename, cytoscapeFilename=None):
+	f = open(filename, "w")
+	c = None
+	if( cytoscapeFilename != None ):
+		c = open(cytoscapeFilename, "w")
+	for (line, cytoscape) in gmlLines(net):
+		f.write(line + "\n")
+		if( c != None and cytoscape ):
+			c.write(line + "\n")
+	f.close()
+	if( c != None ):
+		c.close()
+
+# Strips node labels from a GML file written by NetworkX, making it
+# Cytoscape-compatible. Works line by line, so legacy files of any size can
+# be patched without reading them into memory.
+def patchGMLFile(infile, outfile):
+	with open(infile, "r") as src:
+		with open(outfile, "w") as dst:
+			for line in src:
+				if( not line.lstrip().startswith("label ") ):
+					dst.write(line)
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+import time
+
+# Twitter rate limits are counted over 15 minute windows
+WINDOW = 15 * 60
+
+# Paces requests for a single API key. Rather than firing requests as fast as
+# possible and sleeping once Twitter refuses us, the governor reads the rate
+# limit headers from every response and spreads whatever budget is left
+# evenly over the rest of the window. This keeps traffic smooth, and means we
+# never waste a request on an error we could have seen coming.
+# Not thread safe on its own, the key pool locks around it.
+class Governor(object):
+	def __init__(self):
+		self.limit = None     # Requests per window, once we've seen a response
+		self.remaining = None # Requests left in this window (None if unknown)
+		self.reset = 0        # Unix time when the window resets
+		self.nextRequest = 0  # Earliest time the next request may be sent
+		self.slept = 0.0      # Total seconds spent waiting on this key
+		self.requests = 0
+
+	# If the window has passed we get a fresh budget, though we won't know
+	# exactly when the new window ends until the next response arrives
+	def refresh(self, now):
+		if( self.remaining != None and self.reset <= now ):
+			self.remaining = self.limit
+			self.reset = now + WINDOW
+
+	# Returns the earliest time a request may be sent with this key
+	def nextSlot(self, now):
+		self.refresh(now)
+		if( self.remaining == None ):
+			return max(now, self.nextRequest)
+		if( self.remaining <= 0 ):
+			return self.reset + 10 # 10 second buffer
+		return max(now, self.nextRequest)
+
+	# Claims the next request slot, returning the time it may be sent
+	def reserve(self, now):
+		start = self.nextSlot(now)
+		if( self.remaining == None ):
+			return start
+		if( self.remaining <= 0 ):
+			# Budget refills once the window resets
+			self.remaining = self.limit
+			self.reset = start + WINDOW
+		interval = max(0, self.reset - start) / max(1, self.remaining)
+		self.nextRequest = start + interval
+		self.remaining -= 1
+		self.requests += 1
+		return start
+
+	# Records the rate limit headers from a response
+	def update(self, headers):
+		if( not "x-rate-limit-remaining" in headers ):
+			return
+		if( "x-rate-limit-limit" in headers ):
+			self.limit = int(headers["x-rate-limit-limit"])
+		self.remaining = int(headers["x-rate-limit-remaining"])
+		self.reset = int(headers["x-rate-limit-reset"])
+		if( self.limit == None ):
+			self.limit = self.remaining
+
+	def status(self, now):
+		if( self.remaining == None ):
+			return "budget unknown, slept %.1fs" % self.slept
+		return "%d/%d calls remaining, resets in %ds, slept %.1fs" % (self.remaining, self.limit, max(0, self.reset - now), self.slept)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+import json, os
+import log
+
+# A crawl's progress, so an interrupted crawl can pick up where it left off
+#
+# getLayers appends a line to workdir/journal.jsonl for every user it
+# finishes, with the references it found for them, and another once each
+# layer's user lists and map are saved:
+#
+#   {"layer": 1, "user": "someone", "tweets": 200, "mentions": {...}, "retweets": {...}}
+#   {"layer": 1, "done": true}
+#
+# With --resume, completed layers are skipped (their map is loaded from the
+# mapdir), and users already finished in the layer that was interrupted keep
+# their recorded references rather than being read again.
+#
+# Every line is flushed as it's written, so it survives the crawler
+# crashing or being interrupted. Lines are only synced to disk at the end of
+# each layer, so a power failure can lose the rest of a layer. Only whole
+# lines are read back, in case we died halfway through one, and a line cut
+# off at the end is dropped before we carry on appending.
+
+FILENAME = "journal.jsonl"
+
+class Journal(object):
+	def __init__(self, workdir, resume=False):
+		self.filename = workdir + "/" + FILENAME
+		self.users = dict() # Layer -> {username: (tweets, mentions, retweets)}
+		self.done = set()
+		if( resume and os.path.isfile(self.filename) ):
+			self.read()
+			self.repair()
+		# Starting afresh throws away any earlier crawl's journal
+		self.f = open(self.filename, "a" if resume else "w")
+
+	def read(self):
+		with open(self.filename, "r") as f:
+			for line in f:
+				try:
+					record = json.loads(line)
+				except ValueError:
+					log.log(log.warn, "Ignoring incomplete line in " + self.filename)
+					continue
+				layer = record["layer"]
+				if( record.get("done") ):
+					self.done.add(layer)
+				else:
+					users = self.users.setdefault(layer, dict())
+					users[record["user"]] = (record["tweets"], record["mentions"], record["retweets"])
+
+	# Makes sure the journal ends with a newline, so the next line we append
+	# doesn't run on from one we died halfway through writing. A cut-off line
+	# is removed, but one that's only missing its newline gets it back, since
+	# read() already used it.
+	def repair(self):
+		with open(self.filename, "r+b") as f:
+			end = f.seek(0, os.SEEK_END)
+			start = end
+			while( start > 0 ):
+				chunk = min(start, 4096)
+				f.seek(start - chunk)
+				data = f.read(chunk)
+				newline = data.rfind(b"\n")
+				if( newline != -1 ):
+					start = start - chunk + newline + 1
+					break
+				start -= chunk
+			if( start == end ):
+				return
+			f.seek(start)
+			try:
+				json.loads(f.read())
+				f.write(b"\n")
+			except ValueError:
+				f.truncate(start)
+
+	# The layer to carry on from: the one after the last layer we finished
+	def nextLayer(self):
+		layer = 0
+		while( layer in self.done ):
+			layer += 1
+		return layer
+
+	# Every user we've finished, in any layer
+	def visited(self):
+		users = set()
+		for layer in self.users:
+			users.update(self.users[layer].keys())
+		return users
+
+	# Returns {username: (tweets, mentions, retweets)} for users finished in
+	# a layer
+	def layerUsers(self, layer):
+		return self.users.get(layer, dict())
+
+	def write(self, record):
+		self.f.write(json.dumps(record) + "\n")
+		self.f.flush()
+
+	def userDone(self, layer, username, tweets, mentions, retweets):
+		self.write({"layer": layer, "user": username, "tweets": tweets, "mentions": mentions, "retweets": retweets})
+
+	def layerDone(self, layer):
+		self.write({"layer": layer, "done": True})
+		os.fsync(self.f.fileno())
+
+	def close(self):
+		self.f.close()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+import threading, time, copy
+import log, metrics
+from governor import Governor
+
+# How often to report rate limit state through the log, in seconds
+STATUS_INTERVAL = 5 * 60
+
+# One set of credentials, along with the governor pacing its requests
+class APIKey(object):
+	def __init__(self, api):
+		self.api = api
+		self.governor = Governor()
+
+# Spreads requests over several API keys. Each request goes to whichever key's
+# governor will let it out soonest, favoring the key with the most budget left,
+# so we only sleep when every key is exhausted or paced.
+# Safe to share between download threads.
+class KeyPool(object):
+	def __init__(self, apis):
+		self.keys = [APIKey(api) for api in apis]
+		self.lock = threading.Lock()
+		self.lastStatus = time.time()
+		# tweepy stores the last response on the API object, so every thread
+		# gets its own shallow copy of each API
+		self.local = threading.local()
+
+	def __len__(self):
+		return len(self.keys)
+
+	# Returns a key to make a request with, sleeping until its governor
+	# allows the request to be sent
+	def acquire(self):
+		with self.lock:
+			now = time.time()
+			def priority(key):
+				remaining = key.governor.remaining
+				if( remaining == None ):
+					remaining = float('inf')
+				return (key.governor.nextSlot(now), -remaining)
+			key = min(self.keys, key=priority)
+			start = key.governor.reserve(now)
+			delay = start - now
+			if( delay > 0 ):
+				key.governor.slept += delay
+				metrics.count("rateLimitSleep", delay)
+		if( delay > 60 ):
+			log.log(log.info, "All " + str(len(self.keys)) + " API keys rate limited, sleeping "+str(delay)+" seconds")
+		if( delay > 0 ):
+			time.sleep(delay)
+		self.logStatus()
+		return key
+
+	# Records the rate limit headers from a response made with `key`
+	def update(self, key, response):
+		if( response == None ):
+			return
+		with self.lock:
+			key.governor.update(response.headers)
+
+	# Periodically reports remaining calls, reset times, and time spent
+	# sleeping for each key
+	def logStatus(self):
+		with self.lock:
+			now = time.time()
+			if( now - self.lastStatus < STATUS_INTERVAL ):
+				return
+			self.lastStatus = now
+			lines = []
+			for i in range(0, len(self.keys)):
+				lines.append("key " + str(i) + ": " + self.keys[i].governor.status(now))
+		log.log(log.info, "Rate limit status: " + "; ".join(lines))
+
+	def threadAPI(self, key):
+		if( not hasattr(self.local, "apis") ):
+			self.local.apis = dict()
+		if( not id(key) in self.local.apis ):
+			self.local.apis[id(key)] = copy.copy(key.api)
+		return self.local.apis[id(key)]
+
+	# Wraps an API method (like "user_timeline") so that every request it
+	# makes is paced and routed through the pool. The result can be given to
+	# a tweepy.Cursor just like the original method.
+	def method(self, name):
+		def call(*args, **kwargs):
+			# tweepy's cursors ask for the underlying method object
+			# without making a request
+			if( kwargs.get("create") ):
+				return getattr(self.keys[0].api, name)(*args, **kwargs)
+			key = self.acquire()
+			api = self.threadAPI(key)
+			api.last_response = None
+			metrics.count("apiCalls")
+			start = time.perf_counter()
+			try:
+				return getattr(api, name)(*args, **kwargs)
+			finally:
+				metrics.observe("requestLatency", time.perf_counter() - start)
+				self.update(key, api.last_response)
+		call.pagination_mode = getattr(self.keys[0].api, name).pagination_mode
+		return call
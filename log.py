@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 
-import queue, sys, datetime
+import collections, threading, sys, time, datetime
 
 err = 0
 ERR = 0
@@ -14,9 +14,69 @@ INFORMATION = 2
 debug = 3
 DEBUG = 3
 
-logbuffer = queue.Queue()
+# Messages are appended to a deque, which doesn't need a lock in CPython, and
+# the handler thread writes them out in batches. Lines are flushed once
+# FLUSH_SIZE bytes are waiting or FLUSH_INTERVAL seconds have passed, rather
+# than after every line.
+BATCH_SIZE = 1000
+FLUSH_SIZE = 64 * 1024
+FLUSH_INTERVAL = 1.0
+POLL_INTERVAL = 0.1
+
+labels = {ERR: " ERROR: ", WARN: " WARNING: ", INFO: " Info: ", DEBUG: " Debug: "}
+
+# Messages above this level are dropped by log() before they're queued.
+# Until the handler starts we don't know if debug logging is on, so we
+# keep everything.
+threshold = DEBUG
+
+logbuffer = collections.deque()
+
+# Writes queued messages to the log file. Both the handler thread and
+# shutdown() drain the queue, so writes are locked.
+class LogWriter(object):
+	def __init__(self, logfile):
+		self.logfile = logfile
+		self.lock = threading.Lock()
+		self.unflushed = 0
+		self.lastFlush = time.time()
+		# Every message in a batch gets the same timestamp, and we only
+		# format it again when the second changes
+		self.second = None
+		self.stamp = None
+
+	def timestamp(self, now):
+		second = int(now)
+		if( second != self.second ):
+			self.second = second
+			self.stamp = datetime.datetime.fromtimestamp(second).strftime("%D %H:%M:%S")
+		return self.stamp
+
+	# Writes one batch of messages, returning whether any were waiting
+	def drain(self, force=False):
+		with self.lock:
+			now = time.time()
+			stamp = self.timestamp(now)
+			lines = []
+			found = len(logbuffer) > 0
+			while( len(logbuffer) > 0 and len(lines) < BATCH_SIZE ):
+				(level, msg) = logbuffer.popleft()
+				if( level <= threshold and level in labels ):
+					lines.append(stamp + labels[level] + msg + "\n")
+			if( len(lines) > 0 ):
+				blob = "".join(lines)
+				self.logfile.write(blob)
+				self.unflushed += len(blob)
+			if( self.unflushed > 0 and (force or self.unflushed >= FLUSH_SIZE or now - self.lastFlush >= FLUSH_INTERVAL) ):
+				self.logfile.flush()
+				self.unflushed = 0
+				self.lastFlush = now
+			return found
+
+writer = None
 
 def logHandler(workdir, filename, debug):
+	global threshold, writer
 	if( filename == None ):
 		logfile = sys.stdout
 	# Check for absolute path (logfile starts with '/')
@@ -24,18 +84,22 @@ def logHandler(workdir, filename, debug):
 		logfile = open(filename, "w")
 	else:
 		logfile = open(workdir + "/" + filename, "w")
+	threshold = DEBUG if debug else INFO
+	writer = LogWriter(logfile)
 	while(True):
-		(level, msg) = logbuffer.get()
-		time = datetime.datetime.now().strftime("%D %H:%M:%S")
-		if( level == ERR ):
-			logfile.write(time + " ERROR: " + msg + "\n")
-		elif( level == WARN ):
-			logfile.write(time + " WARNING: " + msg + "\n")
-		elif( level == INFO ):
-			logfile.write(time + " Info: " + msg + "\n")
-		elif( level == DEBUG and debug ):
-			logfile.write(time + " Debug: " + msg + "\n")
-		logfile.flush()
+		# Draining also flushes once FLUSH_INTERVAL has passed, so a quiet
+		# log still gets written out
+		if( not writer.drain() ):
+			time.sleep(POLL_INTERVAL)
 
 def log(level, msg):
-	logbuffer.put((level, msg))
+	if( level <= threshold ):
+		logbuffer.append((level, msg))
+
+# Writes out everything still queued. Call before exiting, since the handler
+# thread is a daemon and won't get the chance.
+def shutdown():
+	if( writer == None ):
+		return
+	while( writer.drain(force=True) ):
+		pass
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+import struct, mmap, sys
+from array import array
+
+# Compact binary storage for maps
+#
+# GML is verbose text, and parsing it dominates runtime for large maps. This
+# format stores the same data as typed columns that can be memory-mapped, so
+# loading a map doesn't involve any parsing at all.
+#
+# A file starts with a header of (magic, version, number of nodes, number of
+# edges), followed by these sections, each padded to an 8 byte boundary:
+#   layer      int32 per node
+#   tweets     uint32 per node
+#   flags      uint8 per node (RETWEETED and MENTIONED bits)
+#   edgeStart  uint32 per node, plus one. Edges are stored sorted by source
+#              (compressed sparse row), so node i's outgoing edges are
+#              edgeStart[i] up to edgeStart[i+1]
+#   target     uint32 per edge
+#   retweets   uint32 per edge
+#   mentions   uint32 per edge
+#   nameStart  uint32 per node, plus one, offsets into the name section
+#   names      UTF-8 usernames, back to back
+# All integers are little-endian.
+
+MAGIC = b"SMAP"
+VERSION = 1
+SUFFIX = ".smap"
+
+RETWEETED = 1
+MENTIONED = 2
+
+headerStruct = struct.Struct("<4sIII")
+
+def isMapFile(filename):
+	return filename.endswith(SUFFIX)
+
+def padding(size):
+	return (8 - size % 8) % 8
+
+# Returns the byte layout of a file with the given number of nodes and edges
+# as a list of (name, typecode, count)
+def sections(numNodes, numEdges, nameBytes):
+	return [
+		("layer", "i", numNodes),
+		("tweets", "I", numNodes),
+		("flags", "B", numNodes),
+		("edgeStart", "I", numNodes + 1),
+		("target", "I", numEdges),
+		("retweets", "I", numEdges),
+		("mentions", "I", numEdges),
+		("nameStart", "I", numNodes + 1),
+		("names", "B", nameBytes),
+	]
+
+# Writes a map. Nodes are given as parallel lists of usernames, layers, tweet
+# counts, and flags. Edges are (source index, target index, retweets,
+# mentions), in any order.
+def writeMap(filename, names, layers, tweets, flags, edges):
+	numNodes = len(names)
+	edges = sorted(edges, key=lambda e: e[0])
+	edgeStart = array("I", [0] * (numNodes + 1))
+	for e in edges:
+		edgeStart[e[0] + 1] += 1
+	for i in range(0, numNodes):
+		edgeStart[i + 1] += edgeStart[i]
+	encodedNames = [name.encode("utf-8") for name in names]
+	nameStart = array("I", [0])
+	for name in encodedNames:
+		nameStart.append(nameStart[-1] + len(name))
+	columns = {
+		"layer": array("i", layers),
+		"tweets": array("I", tweets),
+		"flags": array("B", flags),
+		"edgeStart": edgeStart,
+		"target": array("I", [e[1] for e in edges]),
+		"retweets": array("I", [e[2] for e in edges]),
+		"mentions": array("I", [e[3] for e in edges]),
+		"nameStart": nameStart,
+		"names": array("B", b"".join(encodedNames)),
+	}
+	with open(filename, "wb") as f:
+		f.write(headerStruct.pack(MAGIC, VERSION, numNodes, len(edges)))
+		for (name, typecode, count) in sections(numNodes, len(edges), nameStart[-1]):
+			column = columns[name]
+			if( sys.byteorder == "big" ):
+				column.byteswap()
+			f.write(column.tobytes())
+			f.write(b"\0" * padding(len(column) * column.itemsize))
+
+# A memory-mapped map file. Columns (see above) are available as attributes,
+# and are read straight from the mapped file rather than loaded up front.
+class MapFile(object):
+	def __init__(self, filename):
+		self.file = open(filename, "rb")
+		self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+		data = memoryview(self.mm)
+		self.data = data
+		magic, version, self.numNodes, self.numEdges = headerStruct.unpack(data[:headerStruct.size])
+		if( magic != MAGIC ):
+			raise ValueError("Not a map file: " + filename)
+		if( version != VERSION ):
+			raise ValueError("Unsupported map file version " + str(version))
+		offset = headerStruct.size + padding(headerStruct.size)
+		self.columns = []
+		nameBytes = 0
+		for (name, typecode, count) in sections(self.numNodes, self.numEdges, 0):
+			if( name == "names" ):
+				count = nameBytes
+			size = count * array(typecode).itemsize
+			column = data[offset:offset+size].cast(typecode)
+			if( sys.byteorder == "big" ):
+				column = array(typecode, column)
+				column.byteswap()
+			setattr(self, name, column)
+			self.columns.append(name)
+			if( name == "nameStart" ):
+				nameBytes = column[-1]
+			offset += size + padding(size)
+
+	def name(self, i):
+		return bytes(self.names[self.nameStart[i]:self.nameStart[i+1]]).decode("utf-8")
+
+	def allNames(self):
+		blob = bytes(self.names).decode("utf-8")
+		# Offsets are in bytes, so slice the encoded form for non-ASCII names
+		if( len(blob) != len(self.names) ):
+			return [self.name(i) for i in range(0, self.numNodes)]
+		return [blob[self.nameStart[i]:self.nameStart[i+1]] for i in range(0, self.numNodes)]
+
+	# Source node of every edge, expanded from the row offsets
+	def sources(self):
+		res = array("I")
+		for i in range(0, self.numNodes):
+			res.extend([i] * (self.edgeStart[i+1] - self.edgeStart[i]))
+		return res
+
+	def close(self):
+		# Views into the mapping have to be released before it can close
+		for name in self.columns:
+			column = getattr(self, name)
+			if( isinstance(column, memoryview) ):
+				column.release()
+		self.data.release()
+		self.mm.close()
+		self.file.close()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+
+import threading, time, json, math, functools
+import log
+
+# Counters, histograms, and stage timers for seeing where a crawl spends its
+# time. Anything can record to them, from any thread. Once start() is called
+# a summary goes to the log every REPORT_INTERVAL seconds, and a snapshot is
+# appended to metrics.jsonl in the workdir, one JSON object per line, so
+# throughput can be plotted over the course of a crawl.
+#
+# Stage timers are histograms of how long each run of a stage took, so they
+# report the total time spent in the stage as well as how it's distributed.
+
+REPORT_INTERVAL = 60
+FILENAME = "metrics.jsonl"
+
+# Histogram buckets grow by a factor of sqrt(2), starting at a microsecond
+BUCKET_BASE = 1e-6
+BUCKETS = 64
+
+class Histogram(object):
+	def __init__(self):
+		self.count = 0
+		self.total = 0.0
+		self.min = None
+		self.max = None
+		self.buckets = [0] * BUCKETS
+
+	def add(self, value):
+		self.count += 1
+		self.total += value
+		if( self.min == None or value < self.min ):
+			self.min = value
+		if( self.max == None or value > self.max ):
+			self.max = value
+		bucket = 0
+		if( value > BUCKET_BASE ):
+			bucket = min(BUCKETS - 1, int(2 * math.log2(value / BUCKET_BASE)))
+		self.buckets[bucket] += 1
+
+	# Upper bound of the bucket holding the given fraction of values
+	def percentile(self, fraction):
+		target = fraction * self.count
+		seen = 0
+		for i in range(0, BUCKETS):
+			seen += self.buckets[i]
+			if( seen >= target ):
+				return min(self.max, BUCKET_BASE * (2 ** ((i + 1) / 2.0)))
+		return self.max
+
+	def snapshot(self):
+		if( self.count == 0 ):
+			return {"count": 0, "total": 0.0}
+		return {"count": self.count, "total": self.total, "mean": self.total / self.count,
+		        "min": self.min, "max": self.max, "p50": self.percentile(0.5),
+		        "p90": self.percentile(0.9), "p99": self.percentile(0.99)}
+
+lock = threading.Lock()
+counters = dict()
+histograms = dict()
+started = time.time()
+reporter = None
+
+def count(name, amount=1):
+	with lock:
+		counters[name] = counters.get(name, 0) + amount
+
+def observe(name, value):
+	with lock:
+		if( not name in histograms ):
+			histograms[name] = Histogram()
+		histograms[name].add(value)
+
+# Times a block of code as a run of a stage:
+#   with metrics.timer("save"):
+#       ...
+class timer(object):
+	def __init__(self, name):
+		self.name = name
+
+	def __enter__(self):
+		self.start = time.perf_counter()
+		return self
+
+	def __exit__(self, excType, excValue, traceback):
+		observe(self.name, time.perf_counter() - self.start)
+		return False
+
+# Times every call to a function as a run of a stage
+def timed(name):
+	def decorate(function):
+		@functools.wraps(function)
+		def wrapper(*args, **kwargs):
+			with timer(name):
+				return function(*args, **kwargs)
+		return wrapper
+	return decorate
+
+def snapshot():
+	with lock:
+		now = time.time()
+		return {"time": now, "elapsed": now - started, "counters": dict(counters),
+		        "histograms": dict([(name, histograms[name].snapshot()) for name in histograms])}
+
+# One line for the log, like "apiCalls=120 tweetsFetched=24000 fetch=95.1s"
+def summary(snap):
+	parts = []
+	for name in sorted(snap["counters"]):
+		value = snap["counters"][name]
+		if( isinstance(value, float) ):
+			parts.append("%s=%.1f" % (name, value))
+		else:
+			parts.append("%s=%d" % (name, value))
+	for name in sorted(snap["histograms"]):
+		h = snap["histograms"][name]
+		if( h["count"] > 0 ):
+			parts.append("%s=%.1fs/%d (p50 %.3fs, p99 %.3fs)" % (name, h["total"], h["count"], h["p50"], h["p99"]))
+	return " ".join(parts)
+
+class Reporter(object):
+	def __init__(self, workdir):
+		self.filename = workdir + "/" + FILENAME
+		self.stopped = threading.Event()
+		self.lock = threading.Lock()
+		self.thread = threading.Thread(target=self.run)
+		self.thread.daemon = True
+
+	def report(self):
+		snap = snapshot()
+		# The reporter thread and stop() can both report
+		with self.lock:
+			try:
+				with open(self.filename, "a") as f:
+					f.write(json.dumps(snap) + "\n")
+			except OSError as e:
+				log.log(log.warn, "Could not write metrics: " + str(e))
+		log.log(log.info, "Metrics after %ds: %s" % (snap["elapsed"], summary(snap)))
+
+	def run(self):
+		while( not self.stopped.wait(REPORT_INTERVAL) ):
+			self.report()
+
+	def stop(self):
+		self.stopped.set()
+		self.report()
+
+# Starts periodic reporting to the log and workdir/metrics.jsonl, replacing
+# the metrics from any earlier crawl in the same workdir. When resuming an
+# interrupted crawl we add to its metrics instead; counters and elapsed time
+# start over from zero where the resumed run's snapshots begin.
+def start(workdir, resume=False):
+	global reporter, started
+	started = time.time()
+	reporter = Reporter(workdir)
+	if( not resume ):
+		open(reporter.filename, "w").close()
+	reporter.thread.start()
+
+# Reports one last time. Call before log.shutdown() so the report is written.
+def shutdown():
+	global reporter
+	if( reporter != None ):
+		reporter.stop()
+		reporter = None
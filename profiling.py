@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+
+import cProfile, pstats, threading, atexit, functools, io, os, sys, multiprocessing
+from collections import defaultdict
+
+# Optional cProfile profiling, broken down by pipeline stage
+#
+# socmap.py --profile profiles a crawl, and setting SOCMAP_PROFILE to a
+# directory profiles any of the tools. Importing acquire or analyze starts
+# that, and tools that use neither (patchGML.py) call
+# startFromEnvironment() themselves. Code marks its
+# stages with `with profiling.stage(name):`, which does nothing unless
+# profiling is on. Stages nest, and time is only counted towards the
+# innermost one, so stages add up to the whole run. Each thread gets its own
+# profiler, and they're combined per stage when we're done.
+#
+# For every stage we write a pstats file (open with `python -m pstats` or
+# snakeviz), and a text summary of all stages with the top functions and a
+# breakdown of where time went by library: jsonpickle, GML reading and
+# writing, igraph, networkx, tweepy, and waiting (on the network, on rate
+# limits, or on other threads).
+
+TOP = 25
+
+active = False
+directory = None
+prefix = None
+lock = threading.Lock()
+profiles = defaultdict(list) # Stage name -> [cProfile.Profile, one per thread]
+local = threading.local()
+
+def stack():
+	if( not hasattr(local, "stack") ):
+		local.stack = []
+		local.profiles = dict()
+	return local.stack
+
+def profileFor(name):
+	stack()
+	if( not name in local.profiles ):
+		profile = cProfile.Profile()
+		local.profiles[name] = profile
+		with lock:
+			profiles[name].append(profile)
+	return local.profiles[name]
+
+def enable(profile):
+	try:
+		profile.enable()
+		return True
+	except ValueError:
+		# Newer Pythons only allow one profiler at a time
+		return False
+
+class stage(object):
+	def __init__(self, name):
+		self.name = name
+		self.pushed = False
+
+	def __enter__(self):
+		if( not active ):
+			return self
+		frames = stack()
+		if( len(frames) > 0 and frames[-1] != None ):
+			frames[-1].disable()
+		profile = profileFor(self.name)
+		if( not enable(profile) ):
+			profile = None
+		frames.append(profile)
+		self.pushed = True
+		return self
+
+	def __exit__(self, excType, excValue, traceback):
+		frames = stack()
+		if( not self.pushed or len(frames) == 0 ):
+			return False
+		profile = frames.pop()
+		if( profile != None ):
+			profile.disable()
+		if( len(frames) > 0 and frames[-1] != None ):
+			enable(frames[-1])
+		return False
+
+# Decorator profiling every call to a function as a stage. Also useful for
+# work handed to other threads: pool.submit(profiled("download")(f), ...)
+def profiled(name):
+	def decorate(function):
+		@functools.wraps(function)
+		def wrapper(*args, **kwargs):
+			with stage(name):
+				return function(*args, **kwargs)
+		return wrapper
+	return decorate
+
+# Libraries we attribute time to, checked in order against the file and
+# function name of everything that was profiled
+categories = [
+	("jsonpickle", ["jsonpickle"]),
+	("GML I/O", ["gml", "graphml"]),
+	("igraph", ["igraph"]),
+	("networkx", ["networkx"]),
+	("tweepy", ["tweepy"]),
+]
+
+# Time spent blocked goes to "waiting" instead, whatever library it's in:
+# waiting on other threads, sleeping on rate limits, and the network. So that
+# a function that only has "wait" or "lock" in its name doesn't count, these
+# are matched exactly, by (file, name) for Python functions and by the name
+# cProfile gives builtins, whose file is "~".
+waitingFunctions = [
+	("threading.py", "wait"), # Condition.wait, Event.wait
+	("threading.py", "join"), # Thread.join
+	("concurrent/futures/_base.py", "result"), # Future.result
+	("concurrent/futures/_base.py", "wait"),
+	("~", "<method 'acquire' of '_thread.lock' objects>"),
+	("~", "<method 'acquire' of '_thread.RLock' objects>"),
+	("~", "<method '__enter__' of '_thread.lock' objects>"),
+	("~", "<method '__enter__' of '_thread.RLock' objects>"),
+	("~", "<built-in method time.sleep>"),
+	("~", "<built-in method select.select>"),
+	("~", "<method 'poll' of 'select.poll' objects>"),
+	("~", "<method 'poll' of 'select.epoll' objects>"),
+	("~", "<built-in method _socket.getaddrinfo>"),
+]
+# Every method of these builtin types, and everything in these modules and
+# packages, is network I/O
+waitingTypes = ["_socket.socket", "_ssl._SSLSocket"]
+waitingModules = ["socket.py", "ssl.py", "selectors.py", "http/client.py", "urllib3/", "requests/"]
+
+def waiting(filename, name):
+	path = filename.replace(os.sep, "/")
+	for (file, function) in waitingFunctions:
+		if( name == function and (path == file or path.endswith("/" + file)) ):
+			return True
+	if( path == "~" ):
+		for builtinType in waitingTypes:
+			if( name.endswith(" of '" + builtinType + "' objects>") ):
+				return True
+		return False
+	for module in waitingModules:
+		if( "/" + module in path ):
+			return True
+	return False
+
+def category(function):
+	(filename, line, name) = function
+	if( waiting(filename, name) ):
+		return "waiting"
+	text = (filename + " " + name).lower()
+	for (label, patterns) in categories:
+		for pattern in patterns:
+			if( pattern in text ):
+				return label
+	return "other"
+
+# Returns {category: seconds} for a stage, counting each function's own
+# time so the categories add up to the stage's total
+def breakdown(stats):
+	totals = defaultdict(float)
+	for (function, (cc, nc, tt, ct, callers)) in stats.stats.items():
+		totals[category(function)] += tt
+	return totals
+
+def write():
+	with lock:
+		names = sorted(profiles.keys())
+		stageProfiles = dict([(name, list(profiles[name])) for name in names])
+	summary = io.StringIO()
+	for name in names:
+		stats = None
+		for profile in stageProfiles[name]:
+			try:
+				if( stats == None ):
+					stats = pstats.Stats(profile, stream=summary)
+				else:
+					stats.add(profile)
+			except TypeError:
+				pass # A profile that never ran has no stats
+		if( stats == None ):
+			continue
+		stats.dump_stats(directory + "/" + prefix + "-" + name + ".prof")
+		summary.write("=" * 78 + "\n")
+		summary.write("Stage %s: %.2fs over %d threads\n" % (name, stats.total_tt, len(stageProfiles[name])))
+		totals = breakdown(stats)
+		for label in sorted(totals, key=lambda l: -totals[l]):
+			share = 100.0 * totals[label] / max(stats.total_tt, 1e-9)
+			summary.write("  %-14s %9.2fs %5.1f%%\n" % (label, totals[label], share))
+		summary.write("\nTop %d functions by own time:\n" % TOP)
+		stats.sort_stats("tottime").print_stats(TOP)
+		summary.write("Top %d functions by cumulative time:\n" % TOP)
+		stats.sort_stats("cumulative").print_stats(TOP)
+	with open(directory + "/" + prefix + "-profile.txt", "w") as f:
+		f.write(summary.getvalue())
+
+# Turns profiling on, writing results to outdir with names starting with
+# `name`
+def start(outdir, name):
+	global active, directory, prefix
+	os.makedirs(outdir, exist_ok=True)
+	directory = outdir
+	prefix = name
+	active = True
+
+# Stops profiling and writes out the results
+def finish():
+	global active
+	if( not active ):
+		return
+	frames = stack()
+	while( len(frames) > 0 ):
+		profile = frames.pop()
+		if( profile != None ):
+			profile.disable()
+	active = False
+	write()
+
+# SOCMAP_PROFILE=<directory> profiles a whole tool run as one stage named
+# after the script, with any stages it passes through broken out. Worker
+# processes the tool starts aren't profiled, so they don't overwrite its
+# results.
+def startFromEnvironment():
+	outdir = os.environ.get("SOCMAP_PROFILE")
+	if( outdir == None or len(outdir) == 0 or active ):
+		return
+	if( multiprocessing.parent_process() != None ):
+		return
+	script = os.path.splitext(os.path.basename(sys.argv[0]))[0] or "python"
+	start(outdir, script)
+	stage("main").__enter__()
+	atexit.register(finish)
+
+# Tools get this just by importing acquire or analyze, which import us
+startFromEnvironment()
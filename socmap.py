@@ -5,12 +5,16 @@ import argparse, sys, signal, os, threading
 import tweepy
 
 # Local imports
-import acquire, log
+import acquire, log, metrics, profiling, tweetarchive, cassette
+from keypool import KeyPool
 
 # Signal handler for Control-C
 def sigExit(signal, frame):
 	print("") # Send newline in platform-agnostic way
 	# Perform any cleanup here
+	profiling.finish()
+	metrics.shutdown()
+	log.shutdown()
 	sys.exit(0)
 
 # Custom argument parser that prints usage information
@@ -27,9 +31,15 @@ def parseOptions():
 	parser = Parser(description=descr)
 	# Can't ignore retweets *and* mentions or we'd have nothing to follow!
 	ignoreoptions = parser.add_mutually_exclusive_group()
+	# Streaming starts the next layer's downloads early, which would take
+	# workers away from a priority crawl's most referenced users
+	orderoptions = parser.add_mutually_exclusive_group()
 	parser.add_argument("-c", "--compress", default=False,
 	                    action="store_true", dest="compress", 
 	                    help="Compress downloaded tweets with GZIP")
+	parser.add_argument("-b", "--binary", default=False,
+	                    action="store_true", dest="binary",
+	                    help="Store downloaded tweets in the compact binary format instead of JSON")
 	parser.add_argument("-l", "--layers", default=3,
 	                    action="store", type=int, dest="layers", 
 	                    help="How many layers out to download")
@@ -38,25 +48,49 @@ def parseOptions():
 	                    help="How many tweets to download from each user")
 	parser.add_argument("-M", "--maxreferences", default=float('inf'),
 	                    action="store", type=int, dest="maxreferences",
-	                    help="Maximum number of retweeted and mentioned users to track per user")
+	                    help="Maximum number of retweeted and mentioned users to track per user (the most referenced are kept)")
 	ignoreoptions.add_argument("--ignorementions", default=False,
 						action="store_true", dest="ignorementions",
 						help="Do not follow mentions during mapping")
 	ignoreoptions.add_argument("--ignoreretweets", default=False,
 						action="store_true", dest="ignoreretweets",
 						help="Do not follow retweets during mapping")
+	parser.add_argument("-r", "--refresh", default=False,
+	                    action="store_true", dest="refresh",
+	                    help="Download tweets newer than the ones we have for users already in the tweetdir, instead of skipping them")
+	parser.add_argument("--resume", default=False,
+	                    action="store_true", dest="resume",
+	                    help="Carry on with an interrupted crawl from the journal in the workdir")
+	parser.add_argument("--spill", default=False,
+	                    action="store_true", dest="spill",
+	                    help="Keep each layer's references on disk in the workdir rather than in memory, for very large crawls")
+	orderoptions.add_argument("--priority", default=False,
+	                    action="store_true", dest="priority",
+	                    help="Crawl the most mentioned and retweeted users in each layer first")
+	orderoptions.add_argument("--stream", default=False,
+	                    action="store_true", dest="stream",
+	                    help="Start downloading users as soon as they're found, instead of when their layer starts (needs more than one worker)")
+	parser.add_argument("--budget-calls", metavar="<calls>", default=None,
+	                    action="store", type=int, dest="budgetcalls",
+	                    help="Stop crawling after this many API calls")
+	parser.add_argument("--budget-seconds", metavar="<seconds>", default=None,
+	                    action="store", type=float, dest="budgetseconds",
+	                    help="Stop crawling after this many seconds")
+	parser.add_argument("-W", "--workers", default=1,
+	                    action="store", type=int, dest="workers",
+	                    help="How many users to download tweets from in parallel")
 	parser.add_argument("-w", "--workdir", default=currentdir+"/work",
 	                    action="store", type=str, dest="workdir",
 	                    help="Where to store temporary files")
 	parser.add_argument("-t", "--tweetdir", default=currentdir+"/tweets",
 	                    action="store", type=str, dest="tweetdir",
-	                    help="Where to store downloaded tweets")
+	                    help="Where to store downloaded tweets (a name ending in .sqlite stores them in a single archive)")
 	parser.add_argument("-m", "--mapdir", default=currentdir+"/map",
 	                    action="store", type=str, dest="mapdir",
 	                    help="Where to store map data")
-	parser.add_argument("-a", "--authfile", metavar="<file>", required=True,
+	parser.add_argument("-a", "--authfile", metavar="<file>", default=None,
 	                    action="store", type=str, dest="authfile", 
-	                    help="File containing consumer keys and access tokens")
+	                    help="File containing consumer keys and access tokens (one or more blocks of four lines), required unless replaying")
 	parser.add_argument("-u", "--userlist", metavar="<file>", required=True,
 	                    action="store", type=str, dest="userlist", 
 	                    help="File containing list of starting usernames")
@@ -66,22 +100,40 @@ def parseOptions():
 	parser.add_argument("-d", "--debug", default=False,
 	                    action="store_true", dest="debug",
 	                    help="Enable debug-level logging")
+	parser.add_argument("--profile", default=False,
+	                    action="store_true", dest="profile",
+	                    help="Profile each stage of the crawl, saving the results in the workdir")
+	cassetteoptions = parser.add_mutually_exclusive_group()
+	cassetteoptions.add_argument("--record", metavar="<dir>", default=None,
+	                    action="store", type=str, dest="record",
+	                    help="Save every timeline the API sends us to a cassette directory")
+	cassetteoptions.add_argument("--replay", metavar="<dir>", default=None,
+	                    action="store", type=str, dest="replay",
+	                    help="Download timelines from a cassette directory instead of the API (use a fresh tweetdir)")
 	options = parser.parse_args()
+	if( options.authfile == None and options.replay == None ):
+		parser.error("an auth file is required unless replaying a cassette")
 	return options
 
 # Read authentication keys from a file
+# The file holds one or more blocks of four lines (consumer key, consumer
+# secret, access token, access token secret). Blank lines are ignored, so
+# blocks may be separated by them.
 def loadKeys(authfile):
 	f = open(authfile, "r")
-	lines = f.readlines()
-	consumer_key = lines[0].rstrip()
-	consumer_secret = lines[1].rstrip()
-	access_token = lines[2].rstrip()
-	access_token_secret = lines[3].rstrip()
+	lines = [line.strip() for line in f.readlines()]
 	f.close()
-	auth = tweepy.OAuthHandler(consumer_key, consumer_secret)
-	auth.set_access_token(access_token, access_token_secret)
-	api = tweepy.API(auth)
-	return api
+	lines = [line for line in lines if len(line) > 0]
+	if( len(lines) == 0 or len(lines) % 4 != 0 ):
+		sys.stderr.write("ERROR: Auth file must contain blocks of four lines per key\n")
+		sys.exit(1)
+	apis = []
+	for i in range(0, len(lines), 4):
+		consumer_key, consumer_secret, access_token, access_token_secret = lines[i:i+4]
+		auth = tweepy.OAuthHandler(consumer_key, consumer_secret)
+		auth.set_access_token(access_token, access_token_secret)
+		apis.append(tweepy.API(auth))
+	return KeyPool(apis)
 
 # Pulls initial usernames from a file
 def getUsernames(filename):
@@ -94,8 +146,11 @@ def getUsernames(filename):
 	return usernames
 
 # Make sure the directories we need exist before we try to save files
+# A tweet archive is a file, and gets created when it's first opened
 def createDirectories(options):
 	for d in [options.tweetdir, options.mapdir, options.workdir]:
+		if( d == options.tweetdir and tweetarchive.isArchive(d) ):
+			continue
 		if( not os.path.isdir(d) ):
 			print("WARNING: Directory '" + d + "' does not exist - creating...")
 			os.mkdir(d)
@@ -108,7 +163,19 @@ def startLogging(workdir, logfile, debug):
 if __name__ == "__main__":
 	options = parseOptions()
 	createDirectories(options)
-	api = loadKeys(options.authfile)
+	if( options.replay != None ):
+		api = KeyPool([cassette.ReplayAPI(options.replay)])
+	else:
+		api = loadKeys(options.authfile)
+	if( options.record != None ):
+		api = cassette.Recorder(api, options.record)
 	layer0 = getUsernames(options.userlist)
 	startLogging(options.workdir, options.logfile, options.debug)
+	metrics.start(options.workdir, options.resume)
+	if( options.profile ):
+		profiling.start(options.workdir, "socmap")
+	signal.signal(signal.SIGINT, sigExit)
 	acquire.getLayers(api, options.layers, options, layer0)
+	profiling.finish()
+	metrics.shutdown()
+	log.shutdown()
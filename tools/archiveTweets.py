@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+import sys, os
+
+folder = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(folder + "/..") # Allow us to import files from one level up
+
+import acquire, tweetarchive
+
+# This script copies every user's tweets from a tweetdir into a single tweet
+# archive, which socmap.py and the other tools accept in place of a tweetdir.
+# Users already in the archive are skipped, so an interrupted copy can be
+# restarted.
+
+if __name__ == "__main__":
+	flags = [arg for arg in sys.argv[1:] if arg.startswith("--")]
+	args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+	if( len(args) != 2 or len(set(flags) - set(["--compress"])) > 0 ):
+		print("USAGE: %s <directory with tweets> <archive%s> [--compress]" % (sys.argv[0], tweetarchive.SUFFIX))
+		sys.exit(1)
+	tweetdir = args[0]
+	archiveName = args[1]
+	compress = "--compress" in flags
+
+	if( not tweetarchive.isArchive(archiveName) ):
+		print("ERROR: Archive filename must end in %s" % tweetarchive.SUFFIX)
+		sys.exit(1)
+
+	usernames = acquire.listUsers(tweetdir)
+	present = acquire.presentUsers(usernames, archiveName)
+	copied = 0
+	for username in usernames:
+		if( username in present ):
+			continue
+		tweets = acquire.loadTweetsFromFile(username, tweetdir)
+		acquire.saveTweetsToFile(username, tweets, archiveName, compress)
+		copied += 1
+		if( copied % 1000 == 0 ):
+			print("Copied %d users" % copied)
+	print("Copied %d users" % copied)
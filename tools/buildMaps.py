@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+import sys, os, tempfile, shutil, multiprocessing, argparse
+
+folder = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(folder + "/..") # Allow us to import files from one level up
+
+import acquire, analyze, socmap, mapformat
+
+# This script rebuilds the mention-only, retweet-only, and combined maps of
+# a crawl from the tweets it downloaded: what buildMentionMap.py and
+# buildRTMap.py make, plus the map socmap.py itself makes. All three come
+# from a single pass over the tweetdir, with users read in parallel by
+# --workers=N processes (one per CPU by default).
+
+kinds = ["mentions", "retweets", "combined"]
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Rebuild a crawl's mention, retweet, and combined maps from its tweets.")
+	parser.add_argument("userlist", help="The crawl's seed users, one per line")
+	parser.add_argument("tweetdir", help="Directory (or archive) with the crawl's tweets")
+	parser.add_argument("layers", type=int, help="Number of layers to map")
+	parser.add_argument("mentions", help="Where to save the mention map (.gml or .smap)")
+	parser.add_argument("retweets", help="Where to save the retweet map (.gml or .smap)")
+	parser.add_argument("combined", help="Where to save the combined map (.gml or .smap)")
+	parser.add_argument("--workers", type=int, metavar="N", help="Number of processes to read users with (default: one per CPU)")
+	options = parser.parse_args()
+	origUserlist = socmap.getUsernames(options.userlist)
+	tweetDir = options.tweetdir
+	numLayers = options.layers
+	outFileNames = [options.mentions, options.retweets, options.combined]
+	workers = options.workers
+
+	if( numLayers < 1 ):
+		print("ERROR: Map must include at least one layer")
+		sys.exit(1)
+
+	# Work in a random temp directory so we can run multiple instances of
+	# this script at once
+	workDir = tempfile.TemporaryDirectory()
+	workDirName = workDir.name
+
+	pool = None
+	if( workers != 1 ):
+		pool = multiprocessing.Pool(workers)
+	networks = acquire.rebuildMaps(origUserlist, tweetDir, numLayers, kinds, pool)
+
+	# Now move the final maps over to the user-requested locations
+	for (kind, outFileName) in zip(kinds, outFileNames):
+		networks[kind].save(workDirName, numLayers - 1)
+		origFileName = workDirName + "/layer" + str(numLayers) + ".gml"
+		if( mapformat.isMapFile(outFileName) ):
+			analyze.writeNetwork(analyze.readNetwork(origFileName), outFileName)
+		else:
+			shutil.move(origFileName, outFileName)
@@ -1,20 +1,29 @@
 #!/usr/bin/env python3
 
-import sys, os, tempfile, shutil
+import sys, os, tempfile, shutil, multiprocessing, argparse
 
 folder = os.path.dirname(os.path.realpath(__file__))
 sys.path.append(folder + "/..") # Allow us to import files from one level up
 
-import acquire, analyze, socmap
+import acquire, analyze, socmap, mapformat
+
+# Rebuilds a map from downloaded tweets following only retweets, reading
+# users in parallel with --workers=N processes (one per CPU by default). See
+# buildMaps.py to build the mention, retweet, and combined maps in one go.
 
 if __name__ == "__main__":
-	if( len(sys.argv) != 5 ):
-		print("USAGE: %s <userlist.txt> <directory with tweets> <number of layers> <retweets.gml>" % sys.argv[0])
-		sys.exit(1)
-	origUserlist = socmap.getUsernames(sys.argv[1])
-	tweetDir = sys.argv[2]
-	numLayers = int(sys.argv[3])
-	outFileName = sys.argv[4]
+	parser = argparse.ArgumentParser(description="Rebuild a crawl's map from its tweets, following only retweets.")
+	parser.add_argument("userlist", help="The crawl's seed users, one per line")
+	parser.add_argument("tweetdir", help="Directory (or archive) with the crawl's tweets")
+	parser.add_argument("layers", type=int, help="Number of layers to map")
+	parser.add_argument("map", help="Where to save the map (.gml or .smap)")
+	parser.add_argument("--workers", type=int, metavar="N", help="Number of processes to read users with (default: one per CPU)")
+	options = parser.parse_args()
+	origUserlist = socmap.getUsernames(options.userlist)
+	tweetDir = options.tweetdir
+	numLayers = options.layers
+	outFileName = options.map
+	workers = options.workers
 
 	if( numLayers < 1 ):
 		print("ERROR: Map must include at least one layer")
@@ -25,19 +34,15 @@ if __name__ == "__main__":
 	workDir = tempfile.TemporaryDirectory()
 	workDirName = workDir.name
 
-	# Setup is done, let's read all the tweets we've downloaded
-	userlist = origUserlist
-	for layer in range(0, numLayers):
-		layerRTs = dict()
-		print("Layer %d: Reading data on %d users" % (layer, len(userlist)))
-		for username in userlist:
-			if( acquire.userTweetsPresent(username, tweetDir) ):
-				mentions, rts = acquire.getUserReferences(username, tweetDir)
-				layerRTs[username] = list(rts)
-		print("Layer %d: Saving map" % layer)
-		userlist = acquire.flattenUserDictionary(layerRTs)
-		analyze.saveNetwork(workDirName, layer, origUserlist, layerRTs, dict())
+	pool = None
+	if( workers != 1 ):
+		pool = multiprocessing.Pool(workers)
+	network = acquire.rebuildMaps(origUserlist, tweetDir, numLayers, ["retweets"], pool)["retweets"]
+	network.save(workDirName, numLayers - 1)
 
 	# Now move the final map over to the user-requested location
 	origFileName = workDirName + "/layer" + str(numLayers) + ".gml"
-	shutil.move(origFileName, outFileName)
+	if( mapformat.isMapFile(outFileName) ):
+		analyze.writeNetwork(analyze.readNetwork(origFileName), outFileName)
+	else:
+		shutil.move(origFileName, outFileName)
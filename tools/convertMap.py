@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+import sys, os
+
+folder = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(folder + "/..") # Allow us to import files from one level up
+
+import analyze
+
+# This script converts a map between GML and the binary map format, based on
+# the file extensions. Binary maps are much faster for the other tools to
+# load, GML is for exporting to Gephi or Cytoscape.
+
+if __name__ == "__main__":
+	if( len(sys.argv) != 3 ):
+		print("USAGE: %s <map.gml|map.smap> <converted.smap|converted.gml>" % sys.argv[0])
+		sys.exit(1)
+	analyze.writeNetwork(analyze.readNetwork(sys.argv[1]), sys.argv[2])
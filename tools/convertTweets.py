@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+import sys, os
+
+folder = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(folder + "/..") # Allow us to import files from one level up
+
+import acquire
+
+# This script converts every JSON tweet file in a tweetdir (compressed or not)
+# to the compact binary format. Original files are kept unless --delete is
+# given. Users that already have a binary file are skipped.
+
+if __name__ == "__main__":
+	flags = [arg for arg in sys.argv[1:] if arg.startswith("--")]
+	args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+	if( len(args) != 1 or len(set(flags) - set(["--compress", "--delete"])) > 0 ):
+		print("USAGE: %s <directory with tweets> [--compress] [--delete]" % sys.argv[0])
+		sys.exit(1)
+	tweetdir = args[0]
+	compress = "--compress" in flags
+	delete = "--delete" in flags
+
+	converted = 0
+	for username in acquire.listUsers(tweetdir):
+		source = acquire.userTweetsFilename(username, tweetdir)
+		if( not source.endswith(".json") and not source.endswith(".json.gz") ):
+			continue # Already converted
+		tweets = acquire.loadTweetsFromFile(username, tweetdir)
+		acquire.saveTweetsToFile(username, tweets, tweetdir, compress, binary=True)
+		if( delete ):
+			# Now the binary file's written, remove the file we read and any
+			# other JSON file the user has, compressed or not
+			for (suffix, binary, compressed) in acquire.tweetFileTypes:
+				filename = tweetdir + "/" + username + suffix
+				if( not binary and os.path.isfile(filename) ):
+					os.unlink(filename)
+		converted += 1
+		if( converted % 1000 == 0 ):
+			print("Converted %d users" % converted)
+	print("Converted %d users" % converted)
@@ -2,15 +2,15 @@
 
 import sys, os
 from collections import Counter
-try:
-	import igraph as ig
-	has_igraph = True
-except ImportError:
-	import networkx as nx
-	has_igraph = False
+
+folder = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(folder + "/..") # Allow us to import files from one level up
+
+import analyze
+from analyze import has_igraph
 
 def nxVersion(inFilename):
-	orig = nx.read_gml(inFilename)
+	orig = analyze.readNetwork(inFilename)
 
 	degree = dict()
 	inDegree = dict()
@@ -40,7 +40,7 @@ def nxVersion(inFilename):
 	return (numNodes, degree, inDegree, outDegree)
 
 def igraphVersion(inFilename):
-	g = ig.Graph.Read_GML(inFilename)
+	g = analyze.readNetwork(inFilename)
 	numNodes = len(g.vs)
 	degree = Counter(g.vs.degree())
 	inDegree = Counter(g.vs.indegree())
@@ -49,7 +49,7 @@ def igraphVersion(inFilename):
 
 if __name__ == "__main__":
 	if( len(sys.argv) != 3 ):
-		print("USAGE: %s <percentile> <inputfile.gml>" % sys.argv[0])
+		print("USAGE: %s <percentile> <inputfile.gml|.smap>" % sys.argv[0])
 		sys.exit(1)
 	percentile = int(sys.argv[1])
 	inFilename = sys.argv[2]
@@ -1,7 +1,11 @@
 #!/usr/bin/env python3
 
 import sys, os
-import igraph as ig
+
+folder = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(folder + "/..") # Allow us to import files from one level up
+
+import analyze
 
 """
 	This tools returns a density measurement for each map provided as an argument
@@ -14,5 +18,5 @@ if __name__ == "__main__":
 		sys.exit(1)
 
 	for fname in sys.argv[1:]:
-		net = ig.Graph.Read_GML(fname)
+		net = analyze.readNetwork(fname, useIgraph=True)
 		print("%s,%f" % (fname,net.density()))
@@ -17,18 +17,18 @@ if __name__ == "__main__":
 		sys.exit(1)
 	tweetdir = sys.argv[2]
 	userlist = socmap.getUsernames(sys.argv[1])
+	userset = set(userlist)
 
 	totalRTs = 0
 	insularRTs = 0
 	for user in userlist:
 		if( not acquire.userTweetsPresent(user, tweetdir) ):
 			continue
-		tweets = acquire.loadTweetsFromFile(user, tweetdir)
-		for tweet in tweets:
-			if( isinstance(tweet, acquire.Retweet) ):
-				totalRTs += 1
-				if( tweet.source in userlist ):
-					insularRTs += 1
+		retweeted = acquire.loadUserSummary(user, tweetdir)["retweets"]
+		for source in retweeted:
+			totalRTs += retweeted[source]
+			if( source in userset ):
+				insularRTs += retweeted[source]
 
 	print("Total RTs in userlist: %d" % totalRTs)
 	print("Insular RTs in userlist: %d" % insularRTs)
@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+import sys, os, multiprocessing, argparse
+
+folder = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(folder + "/..") # Allow us to import files from one level up
+
+import tweetindex
+
+# This script builds or updates the inverted index searchTweets.py uses to
+# avoid reading every user's tweets. Only users that are new or have changed
+# since the last run are read, so it's cheap to run again after each crawl.
+# Users are read in parallel by --workers=N processes (one per CPU by
+# default).
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Build or update the index searchTweets.py uses.")
+	parser.add_argument("tweetdir", help="Directory (or archive) with tweets to index")
+	parser.add_argument("--workers", type=int, metavar="N", help="Number of processes to read users with (default: one per CPU)")
+	options = parser.parse_args()
+	tweetdir = options.tweetdir
+	workers = options.workers
+
+	index = tweetindex.TweetIndex(tweetdir)
+	pool = None
+	if( workers != 1 ):
+		pool = multiprocessing.Pool(workers)
+	(indexed, removed) = index.update(pool)
+	index.close()
+	print("Indexed %d users, removed %d" % (indexed, removed))
@@ -1,6 +1,10 @@
 #!/usr/bin/env python3
 import sys, os
-import networkx as nx
+
+folder = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(folder + "/..") # Allow us to import files from one level up
+
+import analyze
 
 if __name__ == "__main__":
 	if( len(sys.argv) != 2 ):
@@ -8,7 +12,7 @@ if __name__ == "__main__":
 		sys.exit(1)
 	inFilename = sys.argv[1]
 
-	orig = nx.read_gml(inFilename)
+	orig = analyze.readNetwork(inFilename, useIgraph=False)
 
 	degree = dict()
 
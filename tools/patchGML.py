@@ -1,18 +1,21 @@
 #!/usr/bin/env python3
-import sys, os, shutil
-import networkx as nx
+import sys, os
 
 folder = os.path.dirname(os.path.realpath(__file__))
 sys.path.append(folder + "/..") # Allow us to import files from one level up
 
-import analyze
+import gml, profiling
+
+# Maps are now written with a Cytoscape-compatible copy alongside them. This
+# script patches older GML files written by NetworkX, one line at a time.
 
 if __name__ == "__main__":
 	if( len(sys.argv) != 3 ):
 		print("USAGE: %s <inputfile.gml> <patched.gml>" % sys.argv[0])
 		sys.exit(1)
+	# We don't import acquire or analyze, which would start this for us
+	profiling.startFromEnvironment()
 	inFilename = sys.argv[1]
 	patchFilename = sys.argv[2]
 
-	shutil.copy(inFilename, patchFilename)
-	analyze.patchGML(patchFilename)
+	gml.patchGMLFile(inFilename, patchFilename)
@@ -1,7 +1,11 @@
 #!/usr/bin/env python3
 
 import sys, os
-import igraph as ig
+
+folder = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(folder + "/..") # Allow us to import files from one level up
+
+import analyze
 
 # This script deletes all nodes that cannot be reached by the seed layer
 
@@ -12,13 +16,5 @@ if __name__ == "__main__":
 	origFilename = sys.argv[1]
 	newFilename = sys.argv[2]
 
-	orig = ig.Graph.Read_GML(origFilename)
-	seeds = orig.vs.select(layer_eq=0)
-	reachable = set()
-	for seed in seeds:
-		s = seed.index # subcomponents wants index form, not object
-		from_s = orig.subcomponent(s, mode=ig.OUT) # Returns list of indices
-		reachable.add(s)
-		reachable.update(from_s)
-	remaining = orig.subgraph(reachable)
-	remaining.write_gml(newFilename)
+	# Pruning nobody leaves just the reachability pass
+	analyze.pruneNetwork(origFilename, [], newFilename)
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+
+import sys, os, argparse
+from collections import Counter
+
+folder = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(folder + "/..") # Allow us to import files from one level up
+
+import analyze
+
+# This script runs a whole chain of pruning steps over a map, loading it once
+# and writing the result once, rather than piping it through pruneMentions.py,
+# pruneRetweets.py, pruneTweets.py, removeLowDegreeNodes.py, and so on.
+#
+# Filters run in the order they're given on the command line. They can also
+# be read from a spec file with one filter per line, like:
+#
+#   # Strong ties between active users, near the seeds
+#   min-mentions 2
+#   min-tweets 10
+#   indegree-percentile 90
+#   reachable
+#
+# Like removeLowDegreeNodes.py, the degree filters never remove seed users.
+
+def mentionsBelow(net, threshold):
+	mentions = net.es["mentions"]
+	net.delete_edges([i for i in range(0, len(mentions)) if mentions[i] < threshold])
+
+def retweetsBelow(net, threshold):
+	retweets = net.es["retweets"]
+	net.delete_edges([i for i in range(0, len(retweets)) if retweets[i] < threshold])
+
+# Edge weight is mentions and retweets combined
+def weightBelow(net, threshold):
+	mentions = net.es["mentions"]
+	retweets = net.es["retweets"]
+	net.delete_edges([i for i in range(0, len(mentions)) if mentions[i] + retweets[i] < threshold])
+
+def tweetsBelow(net, threshold):
+	tweets = net.vs["tweets"]
+	net.delete_vertices([i for i in range(0, len(tweets)) if tweets[i] < threshold])
+
+def degrees(net, mode):
+	if( mode == "in" ):
+		return net.indegree()
+	if( mode == "out" ):
+		return net.outdegree()
+	return net.degree()
+
+def degreeBelow(net, threshold, mode):
+	degree = degrees(net, mode)
+	layers = net.vs["layer"]
+	net.delete_vertices([i for i in range(0, len(degree)) if layers[i] != 0 and degree[i] < threshold])
+
+# Same threshold as getDegreePercentile.py: the smallest degree such that
+# the given percent of users have at least that degree
+def percentileThreshold(net, percentile, mode):
+	counts = Counter(degrees(net, mode))
+	discoveredNodes = 0
+	for dg in sorted(counts.keys(), reverse=True):
+		discoveredNodes += counts[dg]
+		if( discoveredNodes >= ((percentile / 100.0)*len(net.vs)) ):
+			return dg
+	return 0
+
+def degreePercentile(net, percentile, mode):
+	threshold = percentileThreshold(net, percentile, mode)
+	print("%s threshold: Removing nodes with less than %d %s" % (mode + "-degree", threshold, mode + "-degree"))
+	degreeBelow(net, threshold, mode)
+
+# Userlist file in the same format as pruneUsers.py
+def blocklist(net, userfile):
+	with open(userfile, "r") as f:
+		userlist = set([u.lower() for u in f.read().split("\n") if len(u) > 0])
+	names = net.vs["name"]
+	net.delete_vertices([i for i in range(0, len(names)) if names[i] in userlist])
+
+# Like separateRTs.py, keep only the seeds and users that were retweeted
+def retweetedOnly(net):
+	layers = net.vs["layer"]
+	retweeted = net.vs["retweeted"]
+	net.delete_vertices([i for i in range(0, len(layers)) if layers[i] > 0 and retweeted[i] == "false"])
+
+def reachable(net):
+	layers = net.vs["layer"]
+	seeds = [i for i in range(0, len(layers)) if layers[i] == 0]
+	return analyze.pruneUnreachable(net, seeds, forceLowMemoryUsage=True)
+
+def giant(net):
+	return net.components(mode="weak").giant()
+
+# name: (function, argument type or None, help)
+filterTypes = {
+	"min-mentions": (mentionsBelow, int, "Delete edges with fewer mentions"),
+	"min-retweets": (retweetsBelow, int, "Delete edges with fewer retweets"),
+	"min-weight": (weightBelow, int, "Delete edges with fewer mentions and retweets combined"),
+	"min-tweets": (tweetsBelow, int, "Delete users with fewer tweets"),
+	"min-degree": (lambda net, n: degreeBelow(net, n, "all"), int, "Delete users with a lower degree"),
+	"min-indegree": (lambda net, n: degreeBelow(net, n, "in"), int, "Delete users with a lower in-degree"),
+	"min-outdegree": (lambda net, n: degreeBelow(net, n, "out"), int, "Delete users with a lower out-degree"),
+	"degree-percentile": (lambda net, p: degreePercentile(net, p, "all"), int, "Keep roughly the top percentile of users by degree"),
+	"indegree-percentile": (lambda net, p: degreePercentile(net, p, "in"), int, "Keep roughly the top percentile of users by in-degree"),
+	"outdegree-percentile": (lambda net, p: degreePercentile(net, p, "out"), int, "Keep roughly the top percentile of users by out-degree"),
+	"blocklist": (blocklist, str, "Delete users listed in a file, one per line"),
+	"retweeted-only": (retweetedOnly, None, "Delete users (other than seeds) who were never retweeted"),
+	"reachable": (reachable, None, "Delete users the seeds can't reach"),
+	"giant": (giant, None, "Keep only the largest weakly connected component"),
+}
+
+def parseFilter(name, arg):
+	if( not name in filterTypes ):
+		raise ValueError("Unknown filter '%s'" % name)
+	(function, argType, description) = filterTypes[name]
+	if( argType == None ):
+		if( arg != None ):
+			raise ValueError("Filter '%s' doesn't take an argument" % name)
+		return (name, None)
+	if( arg == None ):
+		raise ValueError("Filter '%s' needs an argument" % name)
+	value = argType(arg)
+	if( argType == int and value < 0 ):
+		raise ValueError("Filter '%s' can't have a negative argument" % name)
+	return (name, value)
+
+def loadSpec(filename):
+	filters = []
+	with open(filename, "r") as f:
+		for line in f:
+			line = line.split("#")[0].split()
+			if( len(line) == 0 ):
+				continue
+			if( len(line) > 2 ):
+				raise ValueError("Too many arguments for filter '%s'" % line[0])
+			filters.append(parseFilter(line[0], line[1] if len(line) == 2 else None))
+	return filters
+
+# Collects filters in the order they appear on the command line
+class FilterAction(argparse.Action):
+	def __call__(self, parser, namespace, values, option_string=None):
+		filters = getattr(namespace, "filters")
+		try:
+			if( self.dest == "spec" ):
+				filters.extend(loadSpec(values))
+			else:
+				arg = values if self.nargs != 0 else None
+				filters.append(parseFilter(self.dest.replace("_", "-"), arg))
+		except ValueError as e:
+			parser.error(str(e))
+
+def applyFilters(net, filters):
+	for (name, value) in filters:
+		function = filterTypes[name][0]
+		if( value == None ):
+			result = function(net)
+		else:
+			result = function(net, value)
+		# Some filters build a new network rather than changing it in place
+		if( result != None ):
+			net = result
+		print("%s: %d users, %d edges remaining" % (name, len(net.vs), len(net.es)))
+	return net
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Apply a series of filters to a map, in order.")
+	parser.add_argument("original", help="Map to prune (.gml or .smap)")
+	parser.add_argument("pruned", help="Where to save the pruned map (.gml or .smap)")
+	parser.add_argument("--spec", action=FilterAction, metavar="FILE", help="Read filters from a file, one per line")
+	for name in filterTypes:
+		(function, argType, description) = filterTypes[name]
+		if( argType == None ):
+			parser.add_argument("--" + name, action=FilterAction, nargs=0, help=description)
+		else:
+			parser.add_argument("--" + name, action=FilterAction, metavar="N" if argType == int else "FILE", help=description)
+	parser.set_defaults(filters=[])
+	options = parser.parse_args()
+
+	if( len(options.filters) == 0 ):
+		parser.error("No filters given")
+
+	net = analyze.readNetwork(options.original, useIgraph=True)
+	print("%d users, %d edges loaded" % (len(net.vs), len(net.es)))
+	net = applyFilters(net, options.filters)
+	analyze.writeNetwork(net, options.pruned)
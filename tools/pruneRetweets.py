@@ -1,7 +1,11 @@
 #!/usr/bin/env python3
 
 import sys, os
-import igraph as ig
+
+folder = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(folder + "/..") # Allow us to import files from one level up
+
+import analyze
 
 # This script deletes all edges with < threshold number of retweets
 # It does *not* delete inaccessible nodes afterwards (see pruneInaccessible.py)
@@ -18,7 +22,7 @@ if __name__ == "__main__":
 		print("ERROR: Retweet threshold must be at least one")
 		sys.exit(1)
 
-	orig = ig.Graph.Read_GML(origFilename)
+	orig = analyze.readNetwork(origFilename, useIgraph=True)
 	toPrune = orig.es.select(retweets_lt=retweetThreshold)
 	orig.delete_edges(toPrune)
-	orig.write_gml(newFilename)
+	analyze.writeNetwork(orig, newFilename)
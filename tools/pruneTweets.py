@@ -1,7 +1,11 @@
 #!/usr/bin/env python3
 
 import sys, os
-import igraph as ig
+
+folder = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(folder + "/..") # Allow us to import files from one level up
+
+import analyze
 
 # This script deletes all nodes with < threshold number of tweets
 # It does *not* delete inaccessible nodes afterwards (see pruneInaccessible.py)
@@ -18,7 +22,7 @@ if __name__ == "__main__":
 		print("ERROR: Tweet threshold must be at least one")
 		sys.exit(1)
 
-	orig = ig.Graph.Read_GML(origFilename)
+	orig = analyze.readNetwork(origFilename, useIgraph=True)
 	toPrune = orig.vs.select(tweets_lt=tweetThreshold)
 	orig.delete_vertices(toPrune)
-	orig.write_gml(newFilename)
+	analyze.writeNetwork(orig, newFilename)
@@ -3,6 +3,11 @@
 import sys, os
 import networkx as nx
 
+folder = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(folder + "/..") # Allow us to import files from one level up
+
+import analyze
+
 if __name__ == "__main__":
 	if( len(sys.argv) != 4 ):
 		print("USAGE: %s <degree threshold> <original.gml> <pruned.gml>" % sys.argv[0])
@@ -15,7 +20,7 @@ if __name__ == "__main__":
 		print("ERROR: Degree threshold must be at least one")
 		sys.exit(1)
 
-	orig = nx.read_gml(origFilename)
+	orig = analyze.readNetwork(origFilename, useIgraph=False)
 	pruned = nx.DiGraph()
 
 	remainingUsers = []
@@ -38,4 +43,4 @@ if __name__ == "__main__":
 			remainingEdges.append(edge)
 
 	pruned.add_edges_from(remainingEdges)
-	nx.write_gml(pruned, newFilename)
+	analyze.writeNetwork(pruned, newFilename)
@@ -1,32 +1,63 @@
 #!/usr/bin/env python3
-import sys, os, shutil, re
+import sys, os, shutil, re, multiprocessing, argparse
 
 folder = os.path.dirname(os.path.realpath(__file__))
 sys.path.append(folder + "/..") # Allow us to import files from one level up
 
-from acquire import Tweet, loadTweetsFromFile
+from acquire import Tweet, iterTweetsFromFile, listUsers
+import tweetindex
+
+# Prints every tweet that matches a regular expression (from the start of
+# the tweet, like re.match).
+#
+# If the tweetdir has been indexed with indexTweets.py, only users whose
+# tweets contain the words the expression requires are read. Otherwise, or
+# with --scan, every user is read. Either way users are read in parallel, by
+# --workers=N processes (one per CPU by default), and matches are printed in
+# the same order as reading them one at a time would.
+
+# Returns the text of every tweet of a user's that matches. Run in worker
+# processes.
+def searchUser(args):
+	(term, tweetdir, username) = args
+	search = re.compile(term)
+	return [tweet.text for tweet in iterTweetsFromFile(username, tweetdir) if search.match(tweet.text)]
 
 if __name__ == "__main__":
-	if( len(sys.argv) < 3 ):
-		print("USAGE: %s <search term as regular expression> <tweetdir> [username] ..." % sys.argv[0])
-		sys.exit(1)
-	term = sys.argv[1]
+	parser = argparse.ArgumentParser(description="Print every tweet that matches a regular expression.")
+	parser.add_argument("term", help="Search term, as a regular expression")
+	parser.add_argument("tweetdir", help="Directory (or archive) with tweets to search")
+	parser.add_argument("usernames", nargs="*", default=[], metavar="username", help="Users to search (default: everyone)")
+	parser.add_argument("--scan", default=False, action="store_true", help="Read every user, even if the tweets are indexed")
+	parser.add_argument("--workers", type=int, metavar="N", help="Number of processes to read users with (default: one per CPU)")
+	options = parser.parse_args()
+	term = options.term
 	search = re.compile(term)
-	tweetdir = sys.argv[2]
+	tweetdir = options.tweetdir
+	scan = options.scan
+	workers = options.workers
 
 	# If provided a list of users, check those
-	if( len(sys.argv) >= 4 ):
-		for username in sys.argv[3:]:
-			tweets = loadTweetsFromFile(username, tweetdir)
-			for tweet in tweets:
-				if search.match(tweet.text):
-					print(tweet.text)
-
-	# Otherwise, check all users in the tweetdir by default
+	if( len(options.usernames) > 0 ):
+		usernames = options.usernames
+
+	# Otherwise, check all users in the tweetdir by default, narrowed down by
+	# the index if we have one
+	else:
+		usernames = listUsers(tweetdir)
+		if( not scan and tweetindex.hasIndex(tweetdir) ):
+			index = tweetindex.TweetIndex(tweetdir)
+			candidates = index.candidates(search)
+			index.close()
+			if( candidates != None ):
+				usernames = [u for u in usernames if u in candidates]
+
+	jobs = [(term, tweetdir, username) for username in usernames]
+	if( workers == 1 or len(jobs) < 2 ):
+		results = map(searchUser, jobs)
 	else:
-		for filename in os.listdir(tweetdir):
-			username = os.path.basename(filename).split(".")[0]
-			tweets = loadTweetsFromFile(username, tweetdir)
-			for tweet in tweets:
-				if search.match(tweet.text):
-					print(tweet.text)
+		pool = multiprocessing.Pool(workers)
+		results = pool.imap(searchUser, jobs, chunksize=8)
+	for matches in results:
+		for text in matches:
+			print(text)
@@ -1,13 +1,17 @@
 #!/usr/bin/env python3
-import igraph as ig
-import sys
+import sys, os
+
+folder = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(folder + "/..") # Allow us to import files from one level up
+
+import analyze
 
 if __name__ == "__main__":
 	if( len(sys.argv) != 3 ):
 		print("USAGE: %s <map.gml> <output.gml>" % sys.argv[0])
 		sys.exit(1)
 
-net = ig.Graph.Read_GML(sys.argv[1])
+net = analyze.readNetwork(sys.argv[1], useIgraph=True)
 print("Network loaded.")
 prune = []
 for i,e in enumerate(net.vs):
@@ -18,5 +22,5 @@ net.delete_vertices(prune)
 print("Vertices deleted.")
 net2 = net.components(mode="weak").giant()
 print("Giant component isolated.")
-net2.write_gml(sys.argv[2])
+analyze.writeNetwork(net2, sys.argv[2])
 print("Pruned network saved.")
@@ -6,8 +6,12 @@
 username,degree
 """
 
-import sys
-import igraph as ig
+import sys, os
+
+folder = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(folder + "/..") # Allow us to import files from one level up
+
+import analyze
 
 if __name__ == "__main__":
 	if( len(sys.argv) != 2 ):
@@ -15,7 +19,7 @@ if __name__ == "__main__":
 		sys.exit(1)
 	mapFilename = sys.argv[1]
 
-	orig = ig.Graph.Read_GML(mapFilename)
+	orig = analyze.readNetwork(mapFilename, useIgraph=True)
 
 	users = []
 
@@ -2,6 +2,11 @@
 import sys, os
 import networkx as nx
 
+folder = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(folder + "/..") # Allow us to import files from one level up
+
+import analyze
+
 if __name__ == "__main__":
 	if( len(sys.argv) != 4 ):
 		print("USAGE: %s <inputfile.gml> <retweets.gml> <mentions.gml>" % sys.argv[0])
@@ -10,7 +15,7 @@ if __name__ == "__main__":
 	rtFilename = sys.argv[2]
 	mentionFilename = sys.argv[3]
 
-	orig = nx.read_gml(inFilename)
+	orig = analyze.readNetwork(inFilename, useIgraph=False)
 	rtGraph = nx.DiGraph()
 	mentionGraph = nx.DiGraph()
 
@@ -40,5 +45,5 @@ if __name__ == "__main__":
 	rtGraph.add_edges_from(rtCopyEdges)
 	mentionGraph.add_edges_from(mentionCopyEdges)
 
-	nx.write_gml(rtGraph, rtFilename)
-	nx.write_gml(mentionGraph, mentionFilename)
+	analyze.writeNetwork(rtGraph, rtFilename)
+	analyze.writeNetwork(mentionGraph, mentionFilename)
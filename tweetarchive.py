@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+import sqlite3, threading, zlib, json, os
+
+# A single-file alternative to a tweetdir full of per-user files
+#
+# Each user is one row holding their tweets in our binary format (see
+# tweetformat), optionally zlib compressed, along with the same summary we'd
+# otherwise keep in tweetdir/.summaries. Presence checks are an index lookup,
+# a whole frontier can be checked in a handful of queries, and scans read
+# users back in the order they were saved.
+#
+# acquire treats any "tweetdir" ending in .sqlite as an archive, so the
+# crawler and the tools can use one just by pointing at it.
+
+SUFFIX = ".sqlite"
+
+# SQLite caps the number of parameters in a single query
+BATCH_SIZE = 500
+
+def isArchive(tweetdir):
+	return tweetdir.endswith(SUFFIX)
+
+class TweetArchive(object):
+	def __init__(self, filename):
+		self.filename = filename
+		# SQLite connections can't be shared between threads, or with
+		# processes forked from this one
+		self.local = threading.local()
+		db = self.connection()
+		db.execute("CREATE TABLE IF NOT EXISTS users (username TEXT PRIMARY KEY, compressed INTEGER, tweets BLOB, summary TEXT)")
+		db.commit()
+
+	def connection(self):
+		if( getattr(self.local, "pid", None) != os.getpid() ):
+			db = sqlite3.connect(self.filename, timeout=60)
+			db.execute("PRAGMA journal_mode=WAL")
+			db.execute("PRAGMA synchronous=NORMAL")
+			self.local.db = db
+			self.local.pid = os.getpid()
+		return self.local.db
+
+	def present(self, username):
+		cursor = self.connection().execute("SELECT 1 FROM users WHERE username = ?", (username,))
+		return cursor.fetchone() != None
+
+	# Returns the subset of usernames we have tweets for
+	def presentUsers(self, usernames):
+		usernames = list(usernames)
+		found = set()
+		db = self.connection()
+		for i in range(0, len(usernames), BATCH_SIZE):
+			batch = usernames[i:i+BATCH_SIZE]
+			query = "SELECT username FROM users WHERE username IN (" + ",".join(["?"] * len(batch)) + ")"
+			for (username,) in db.execute(query, batch):
+				found.add(username)
+		return found
+
+	# Returns the number of bytes stored for the tweets
+	def save(self, username, data, compressed, summary):
+		if( compressed ):
+			data = zlib.compress(data)
+		db = self.connection()
+		db.execute("INSERT OR REPLACE INTO users (username, compressed, tweets, summary) VALUES (?, ?, ?, ?)",
+		           (username, int(compressed), data, json.dumps(summary)))
+		db.commit()
+		return len(data)
+
+	# Returns a user's tweets in binary format, or None if we don't have them
+	def load(self, username):
+		cursor = self.connection().execute("SELECT compressed, tweets FROM users WHERE username = ?", (username,))
+		row = cursor.fetchone()
+		if( row == None ):
+			return None
+		(compressed, data) = row
+		if( compressed ):
+			return zlib.decompress(data)
+		return bytes(data)
+
+	# Returns a user's summary, or None if we don't have one
+	def summary(self, username):
+		cursor = self.connection().execute("SELECT summary FROM users WHERE username = ?", (username,))
+		row = cursor.fetchone()
+		if( row == None or row[0] == None ):
+			return None
+		return json.loads(row[0])
+
+	def saveSummary(self, username, summary):
+		db = self.connection()
+		db.execute("UPDATE users SET summary = ? WHERE username = ?", (json.dumps(summary), username))
+		db.commit()
+
+	def delete(self, username):
+		db = self.connection()
+		db.execute("DELETE FROM users WHERE username = ?", (username,))
+		db.commit()
+
+	# Sequential scan over every user in the archive, read in chunks so we
+	# can keep saving to the archive while scanning it
+	def usernames(self):
+		lastRow = 0
+		while True:
+			query = "SELECT rowid, username FROM users WHERE rowid > ? ORDER BY rowid LIMIT ?"
+			rows = self.connection().execute(query, (lastRow, BATCH_SIZE)).fetchall()
+			if( len(rows) == 0 ):
+				return
+			for (rowid, username) in rows:
+				yield username
+			lastRow = rows[-1][0]
+
+	# Returns (username, "rowid:size of their stored tweets") for every user.
+	# Saving a user's tweets again replaces their row, which gives it a new
+	# rowid, so this changes even if the size doesn't.
+	def stamps(self):
+		lastRow = 0
+		while True:
+			query = "SELECT rowid, username, length(tweets) FROM users WHERE rowid > ? ORDER BY rowid LIMIT ?"
+			rows = self.connection().execute(query, (lastRow, BATCH_SIZE)).fetchall()
+			if( len(rows) == 0 ):
+				return
+			for (rowid, username, size) in rows:
+				yield (username, str(rowid) + ":" + str(size))
+			lastRow = rows[-1][0]
+
+archives = dict()
+archivesLock = threading.Lock()
+
+# Returns the (shared) archive stored in a file, creating it if needed
+def openArchive(filename):
+	with archivesLock:
+		if( not filename in archives ):
+			archives[filename] = TweetArchive(filename)
+		return archives[filename]
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+
+import struct, datetime
+
+# Compact binary storage for tweets
+#
+# A file starts with a magic number and a format version, followed by a
+# stream of records. Every record starts with a one byte tag:
+#   NAME:    uint16 length, UTF-8 username. Names are numbered in the order
+#            they appear, and tweets refer to users by that number, so each
+#            username is only stored once per file
+#   TWEET:   uint32 user, int64 timestamp, int64 tweet ID, uint16 mention
+#            count, one uint32 per mentioned user, uint32 text length, UTF-8
+#            text
+#   RETWEET: the same fields as TWEET, then uint32 source, uint32 retweets
+# Timestamps are seconds since the epoch (UTC). Integers are little-endian.
+# Records can be read one at a time, so a file never has to fit in memory.
+#
+# Version 1 files have no tweet IDs, and are still read, with IDs of None.
+# An ID of 0 is also read as None, for tweets we never knew the ID of.
+
+MAGIC = b"SMTW"
+VERSION = 2
+
+NAME = 0
+TWEET = 1
+RETWEET = 2
+
+headerStruct = struct.Struct("<4sB")
+tagStruct = struct.Struct("<B")
+nameStruct = struct.Struct("<H")
+tweetStruct = struct.Struct("<IqqH")
+tweetStructV1 = struct.Struct("<IqH")
+textStruct = struct.Struct("<I")
+retweetStruct = struct.Struct("<II")
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+# Tweepy gives us naive datetimes in UTC
+def toTimestamp(date):
+	if( date.tzinfo != None ):
+		return int(date.timestamp())
+	return int((date - EPOCH).total_seconds())
+
+def fromTimestamp(timestamp):
+	return EPOCH + datetime.timedelta(seconds=timestamp)
+
+# Writes tweets to an open binary file, interning usernames as it goes
+class TweetWriter(object):
+	def __init__(self, f):
+		self.f = f
+		self.names = dict()
+		f.write(headerStruct.pack(MAGIC, VERSION))
+
+	def nameID(self, username):
+		if( not username in self.names ):
+			encoded = username.encode("utf-8")
+			self.f.write(tagStruct.pack(NAME) + nameStruct.pack(len(encoded)) + encoded)
+			self.names[username] = len(self.names)
+		return self.names[username]
+
+	# Works with anything shaped like acquire.Tweet or acquire.Retweet
+	def write(self, tweet):
+		source = getattr(tweet, "source", None)
+		user = self.nameID(tweet.user)
+		mentions = [self.nameID(m) for m in tweet.mentions]
+		if( source != None ):
+			sourceID = self.nameID(source)
+		text = tweet.text.encode("utf-8")
+		record = [tagStruct.pack(RETWEET if source != None else TWEET)]
+		record.append(tweetStruct.pack(user, toTimestamp(tweet.timestamp), getattr(tweet, "id", None) or 0, len(mentions)))
+		record.append(struct.pack("<" + str(len(mentions)) + "I", *mentions))
+		record.append(textStruct.pack(len(text)))
+		record.append(text)
+		if( source != None ):
+			record.append(retweetStruct.pack(sourceID, tweet.retweets))
+		self.f.write(b"".join(record))
+
+def writeTweets(f, tweets):
+	writer = TweetWriter(f)
+	for tweet in tweets:
+		writer.write(tweet)
+
+def readExactly(f, size):
+	data = f.read(size)
+	if( len(data) != size ):
+		raise ValueError("Truncated tweet file")
+	return data
+
+# Reads tweets back one at a time from an open binary file
+# Yields tuples of (user, text, timestamp, mentions, source, retweets, id),
+# where source is None for tweets that aren't retweets
+def readTweets(f):
+	magic, version = headerStruct.unpack(readExactly(f, headerStruct.size))
+	if( magic != MAGIC ):
+		raise ValueError("Not a tweet file")
+	if( version < 1 or version > VERSION ):
+		raise ValueError("Unsupported tweet file version " + str(version))
+	names = []
+	while True:
+		tag = f.read(1)
+		if( len(tag) == 0 ):
+			return
+		tag = tag[0]
+		if( tag == NAME ):
+			(length,) = nameStruct.unpack(readExactly(f, nameStruct.size))
+			names.append(readExactly(f, length).decode("utf-8"))
+			continue
+		if( tag != TWEET and tag != RETWEET ):
+			raise ValueError("Unknown record type " + str(tag))
+		if( version == 1 ):
+			user, timestamp, numMentions = tweetStructV1.unpack(readExactly(f, tweetStructV1.size))
+			tweetID = 0
+		else:
+			user, timestamp, tweetID, numMentions = tweetStruct.unpack(readExactly(f, tweetStruct.size))
+		mentions = struct.unpack("<" + str(numMentions) + "I", readExactly(f, 4 * numMentions))
+		(length,) = textStruct.unpack(readExactly(f, textStruct.size))
+		text = readExactly(f, length).decode("utf-8")
+		source = None
+		retweets = 0
+		if( tag == RETWEET ):
+			sourceID, retweets = retweetStruct.unpack(readExactly(f, retweetStruct.size))
+			source = names[sourceID]
+		yield (names[user], text, fromTimestamp(timestamp), [names[m] for m in mentions], source, retweets, tweetID or None)
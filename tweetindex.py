@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+
+import sqlite3, os, re
+import acquire, tweetarchive
+
+try:
+	import re._parser as sre_parse # Python 3.11 and later
+except ImportError:
+	import sre_parse
+
+# An inverted index over a tweetdir, for narrowing down which users a search
+# has to read
+#
+# For every user we record the set of terms in their tweets: lowercased
+# words, plus hashtags and mentions with their # or @. Searching takes the
+# literal text a regular expression requires, finds the users who have it,
+# and only reads their tweets to check the expression properly. The index
+# only narrows things down, so it's never wrong about a match, just more or
+# less helpful.
+#
+# Each user is stamped with the size and modification time of their tweet
+# file (or for archives, the rowid and size of their row), so updating the
+# index only reads users that are new or have changed since, and searches
+# read any stale users directly rather than trusting the index for them.
+#
+# A tweetdir's index lives in tweetdir/.index.sqlite, and an archive's index
+# in a file next to it.
+
+FILENAME = ".index.sqlite"
+ARCHIVE_SUFFIX = "-index"
+
+# Users written to the index per transaction while updating
+COMMIT_EVERY = 500
+
+wordPattern = re.compile(r"\w+")
+tagPattern = re.compile(r"[#@]\w+")
+
+def indexFilename(tweetdir):
+	if( tweetarchive.isArchive(tweetdir) ):
+		return tweetdir + ARCHIVE_SUFFIX
+	return tweetdir + "/" + FILENAME
+
+def hasIndex(tweetdir):
+	return os.path.isfile(indexFilename(tweetdir))
+
+# Returns {username: stamp} for every user in the tweetdir, without reading
+# any tweets
+def stamps(tweetdir):
+	if( tweetarchive.isArchive(tweetdir) ):
+		return dict(tweetarchive.openArchive(tweetdir).stamps())
+	result = dict()
+	for username in acquire.listUsers(tweetdir):
+		st = os.stat(acquire.userTweetsFilename(username, tweetdir))
+		result[username] = str(st.st_mtime_ns) + ":" + str(st.st_size)
+	return result
+
+def terms(text):
+	text = text.lower()
+	return set(wordPattern.findall(text)) | set(tagPattern.findall(text))
+
+# Returns (username, every term in their tweets). Run in worker processes.
+def userTerms(args):
+	(username, tweetdir) = args
+	found = set()
+	for tweet in acquire.iterTweetsFromFile(username, tweetdir):
+		found |= terms(tweet.text)
+	return (username, found)
+
+class TweetIndex(object):
+	def __init__(self, tweetdir):
+		self.tweetdir = tweetdir
+		self.db = sqlite3.connect(indexFilename(tweetdir), timeout=60)
+		self.db.execute("PRAGMA journal_mode=WAL")
+		self.db.execute("CREATE TABLE IF NOT EXISTS users (id INTEGER PRIMARY KEY, username TEXT UNIQUE, stamp TEXT)")
+		self.db.execute("CREATE TABLE IF NOT EXISTS terms (id INTEGER PRIMARY KEY, term TEXT UNIQUE)")
+		self.db.execute("CREATE TABLE IF NOT EXISTS postings (term INTEGER, user INTEGER, PRIMARY KEY (term, user)) WITHOUT ROWID")
+		self.db.execute("CREATE INDEX IF NOT EXISTS postingsByUser ON postings (user)")
+		self.db.commit()
+		self.termIDs = None
+
+	def close(self):
+		self.db.close()
+
+	def indexedStamps(self):
+		return dict(self.db.execute("SELECT username, stamp FROM users"))
+
+	# Returns the users in the tweetdir that the index is missing or has an
+	# old copy of, and the users it has that are no longer in the tweetdir
+	def stale(self, current=None):
+		if( current == None ):
+			current = stamps(self.tweetdir)
+		indexed = self.indexedStamps()
+		changed = [u for u in current if indexed.get(u) != current[u]]
+		removed = [u for u in indexed if not u in current]
+		return (changed, removed)
+
+	def termID(self, term):
+		if( not term in self.termIDs ):
+			cursor = self.db.execute("INSERT INTO terms (term) VALUES (?)", (term,))
+			self.termIDs[term] = cursor.lastrowid
+		return self.termIDs[term]
+
+	def removeUser(self, username):
+		row = self.db.execute("SELECT id FROM users WHERE username = ?", (username,)).fetchone()
+		if( row != None ):
+			self.db.execute("DELETE FROM postings WHERE user = ?", row)
+			self.db.execute("DELETE FROM users WHERE id = ?", row)
+
+	def addUser(self, username, stamp, found):
+		self.removeUser(username)
+		cursor = self.db.execute("INSERT INTO users (username, stamp) VALUES (?, ?)", (username, stamp))
+		user = cursor.lastrowid
+		self.db.executemany("INSERT INTO postings (term, user) VALUES (?, ?)",
+		                    [(self.termID(term), user) for term in found])
+
+	# Brings the index up to date with the tweetdir, reading only new and
+	# changed users. Decoding is spread over `pool` (a multiprocessing pool)
+	# if there is one. Returns (users indexed, users removed).
+	def update(self, pool=None):
+		current = stamps(self.tweetdir)
+		(changed, removed) = self.stale(current)
+		if( self.termIDs == None ):
+			self.termIDs = dict([(term, i) for (i, term) in self.db.execute("SELECT id, term FROM terms")])
+		for username in removed:
+			self.removeUser(username)
+		jobs = [(username, self.tweetdir) for username in changed]
+		if( pool != None ):
+			results = pool.imap_unordered(userTerms, jobs, chunksize=16)
+		else:
+			results = map(userTerms, jobs)
+		indexed = 0
+		for (username, found) in results:
+			self.addUser(username, current[username], found)
+			indexed += 1
+			if( indexed % COMMIT_EVERY == 0 ):
+				self.db.commit()
+		self.db.commit()
+		return (indexed, len(removed))
+
+	# Returns the set of indexed users whose terms match a required word
+	def usersWith(self, word, exact, prefix):
+		if( exact ):
+			termQuery = "SELECT id FROM terms WHERE term = ?"
+			params = (word,)
+		elif( prefix ):
+			# Everything from word up to (not including) word with its last
+			# character bumped by one
+			termQuery = "SELECT id FROM terms WHERE term >= ? AND term < ?"
+			params = (word, word[:-1] + chr(ord(word[-1]) + 1))
+		else:
+			termQuery = "SELECT id FROM terms WHERE instr(term, ?) > 0"
+			params = (word,)
+		query = ("SELECT DISTINCT users.username FROM postings JOIN users ON users.id = postings.user "
+		         "WHERE postings.term IN (" + termQuery + ")")
+		return set([username for (username,) in self.db.execute(query, params)])
+
+	# Returns the set of users who might have a tweet matching `pattern` (a
+	# compiled regular expression, used with match()), or None if the index
+	# can't narrow the search down at all. Users the index is out of date
+	# for are always included.
+	def candidates(self, pattern):
+		found = None
+		for (word, exact, prefix) in requiredWords(pattern):
+			users = self.usersWith(word, exact, prefix)
+			found = users if found == None else found & users
+		if( found == None ):
+			return None
+		(changed, removed) = self.stale()
+		return (found - set(removed)) | set(changed)
+
+# Pulls the literal text out of a regular expression that every match has
+# to contain. Returns a list of (text, left bounded, right bounded), where a
+# bounded side is known to be the start or end of a word in any match.
+def requiredLiterals(parsed, atStart=False):
+	literals = []
+	run = []
+	state = {"left": atStart}
+	def flush(rightBounded):
+		if( len(run) > 0 ):
+			literals.append(("".join(run), state["left"], rightBounded))
+			del run[:]
+		state["left"] = False
+	for (op, av) in parsed:
+		if( op == sre_parse.LITERAL ):
+			run.append(chr(av))
+		elif( op == sre_parse.AT and av == sre_parse.AT_BOUNDARY ):
+			flush(True)
+			state["left"] = True
+		elif( op == sre_parse.AT and av in (sre_parse.AT_BEGINNING, sre_parse.AT_BEGINNING_STRING) ):
+			# The start of the tweet, or of a line
+			flush(False)
+			state["left"] = True
+		elif( op == sre_parse.SUBPATTERN ):
+			flush(False)
+			literals += requiredLiterals(av[-1])
+		elif( op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) or op == getattr(sre_parse, "POSSESSIVE_REPEAT", None) ):
+			flush(False)
+			(least, most, item) = av
+			if( least >= 1 ):
+				literals += requiredLiterals(item)
+		elif( op == getattr(sre_parse, "ATOMIC_GROUP", None) ):
+			flush(False)
+			literals += requiredLiterals(av)
+		else:
+			# Anything else (alternatives, character classes, lookarounds,
+			# backreferences) might match all sorts of text
+			flush(False)
+	flush(False)
+	return literals
+
+# Returns the words a match of `pattern` must contain, as a list of
+# (word, exact, prefix): exact words are whole terms in the index, prefix
+# words are the start of a term, and the rest may be anywhere in one.
+def requiredWords(pattern):
+	words = []
+	# match() anchors the search at the start of the tweet
+	for (text, leftBounded, rightBounded) in requiredLiterals(sre_parse.parse(pattern.pattern, pattern.flags), True):
+		text = text.lower()
+		for found in wordPattern.finditer(text):
+			(start, end) = found.span()
+			left = start > 0 or leftBounded
+			right = end < len(text) or rightBounded
+			word = found.group()
+			# Hashtags and mentions are far more selective than their words
+			if( start > 0 and text[start - 1] in "#@" ):
+				word = text[start - 1] + word
+				left = True
+			words.append((word, left and right, left))
+	return words